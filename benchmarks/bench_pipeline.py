@@ -0,0 +1,231 @@
+"""End-to-end throughput benchmark of Cliper and WebCliper against the fake services.
+
+Runs ``Cliper.update_web_clips`` and ``WebCliper.edit_articles`` once per
+concurrency level, each on a fresh fake dataset, and reports pages per second
+plus per-page, per-endpoint and per-model latency percentiles::
+
+    python -m benchmarks.bench_pipeline --pages 200 --concurrency 1,4,8,16 \\
+        --notion-latency 0.05 --glm-latency 0.8 --glm-jitter 0.4
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+from typing import List, Optional
+
+from benchmarks.fake_services import Behavior, FakeGlm, FakeNotion, FakeOllama
+from metrics import Metrics
+
+# Only the fake servers are contacted; the clients just need some credentials.
+os.environ.setdefault("NOTION_TOKEN", "bench")
+os.environ.setdefault("GLM_API_KEY", "bench")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline Cliper/WebCliper throughput benchmark")
+    parser.add_argument("--pages", type=int, default=100, help="Dataset size (default: 100)")
+    parser.add_argument("--blocks-per-page", type=int, default=20,
+                        help="Blocks per page and per nested toggle for WebCliper (default: 20)")
+    parser.add_argument("--block-depth", type=int, default=1,
+                        help="Nesting depth of the page content blocks (default: 1, flat)")
+    parser.add_argument("--concurrency", default="1,4,8",
+                        help="Comma-separated Cliper worker counts (default: 1,4,8)")
+    parser.add_argument("--notion-concurrency", type=int, default=None,
+                        help="Cliper in-flight Notion request cap (default: same as workers)")
+    parser.add_argument("--notion-latency", type=float, default=0.05)
+    parser.add_argument("--notion-jitter", type=float, default=0.02)
+    parser.add_argument("--notion-rate-limit", type=float, default=None,
+                        help="Server-side Notion requests/second before answering 429")
+    parser.add_argument("--notion-error-rate", type=float, default=0.0)
+    parser.add_argument("--client-notion-rps", type=float, default=None,
+                        help="Client-side Notion rate limit, like NOTION_REQUESTS_PER_SECOND")
+    parser.add_argument("--glm-latency", type=float, default=0.5)
+    parser.add_argument("--glm-jitter", type=float, default=0.2)
+    parser.add_argument("--glm-rate-limit", type=float, default=None)
+    parser.add_argument("--glm-error-rate", type=float, default=0.0)
+    parser.add_argument("--glm-tail-rate", type=float, default=0.0,
+                        help="Fraction of GLM requests that are slow by --glm-tail-latency")
+    parser.add_argument("--glm-tail-latency", type=float, default=0.0)
+    parser.add_argument("--secondary-glm-latency", type=float, default=None,
+                        help="Add a second fake GLM provider with this latency and run Cliper "
+                             "through a FailoverBackend that hedges to it")
+    parser.add_argument("--glm-token-interval", type=float, default=0.0,
+                        help="Seconds the fake GLM takes per four characters of output")
+    parser.add_argument("--glm-chatter", type=int, default=0,
+                        help="Chunks of extra text the fake GLM appends after each answer")
+    parser.add_argument("--glm-stream", action="store_true",
+                        help="Stream GLM completions and stop at the complete answer")
+    parser.add_argument("--ollama-latency", type=float, default=1.0)
+    parser.add_argument("--ollama-jitter", type=float, default=0.3)
+    parser.add_argument("--ollama-parallel", type=int, default=4,
+                        help="Parallel request slots of the fake Ollama server (default: 4)")
+    parser.add_argument("--webcliper-concurrency", default="1,4",
+                        help="Comma-separated WebCliper worker counts (default: 1,4)")
+    parser.add_argument("--skip-webcliper", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true",
+                        help="Show the per-page log lines of the benchmarked code")
+    parser.add_argument("--json-out", default=None, help="Also write the results as JSON")
+    return parser.parse_args()
+
+
+def bench_cliper(args: argparse.Namespace, workers: int) -> dict:
+    from cliper import Cliper
+    from glm_ai import GlmAi
+    from llm_backend import FailoverBackend
+    from notion_api import notion_rate_limiter
+
+    notion_behavior = Behavior(args.notion_latency, args.notion_jitter, args.notion_rate_limit,
+                               args.notion_error_rate, seed=args.seed)
+    glm_behavior = Behavior(args.glm_latency, args.glm_jitter, args.glm_rate_limit,
+                            args.glm_error_rate, seed=args.seed, tail_rate=args.glm_tail_rate,
+                            tail_latency=args.glm_tail_latency)
+    with contextlib.ExitStack() as stack:
+        notion = stack.enter_context(FakeNotion(args.pages, behavior=notion_behavior))
+        glm = stack.enter_context(FakeGlm(glm_behavior, token_interval=args.glm_token_interval,
+                                          chatter=args.glm_chatter))
+        metrics = Metrics()
+        llm_backend = None
+        if args.secondary_glm_latency is not None:
+            secondary = stack.enter_context(FakeGlm(
+                Behavior(args.secondary_glm_latency, args.glm_jitter, seed=args.seed + 1),
+                token_interval=args.glm_token_interval, chatter=args.glm_chatter,
+            ))
+            llm_backend = FailoverBackend({
+                name: GlmAi(base_url=server.chat_url, env_file=None, stream=args.glm_stream,
+                            metrics=metrics)
+                for name, server in (("primary", glm), ("secondary", secondary))
+            }, metrics=metrics, concurrency=workers)
+            stack.callback(llm_backend.close)
+        if args.client_notion_rps:
+            notion_rate_limiter.set_rate("127.0.0.1", args.client_notion_rps)
+        os.environ["GLM_BASE_URL"] = glm.chat_url
+        cliper = Cliper(
+            env_file=None,
+            workers=workers,
+            notion_concurrency=args.notion_concurrency or workers,
+            metrics=metrics,
+            notion_url=f"{notion.url}/v1",
+            stream=args.glm_stream,
+            llm_backend=llm_backend,
+        )
+        with quiet(args):
+            cliper.update_web_clips(notion.query_url)
+        return report("Cliper.update_web_clips", workers, metrics)
+
+
+def bench_webcliper(args: argparse.Namespace, workers: int) -> Optional[dict]:
+    try:
+        from webcliper import WebCliper
+    except ImportError as exc:
+        print(f"跳过 WebCliper 基准测试: {exc}")
+        return None
+
+    class TimedWebCliper(WebCliper):
+        def summary_content(self, id, blocks=None, last_edited_time=None):
+            with metrics.timer("stage_seconds", stage="page"):
+                ok = super().summary_content(id, blocks, last_edited_time)
+            metrics.inc("pages_total", result="written" if ok else "failed")
+            return ok
+
+    notion_behavior = Behavior(args.notion_latency, args.notion_jitter, args.notion_rate_limit,
+                               args.notion_error_rate, seed=args.seed)
+    with FakeNotion(args.pages, args.blocks_per_page, notion_behavior, args.block_depth) as notion:
+        os.environ["NOTION_API_BASE"] = f"{notion.url}/v1"
+        metrics = Metrics()
+        cliper = TimedWebCliper(env_file=None, workers=workers,
+                                ollama_parallel=min(workers, args.ollama_parallel),
+                                metrics=metrics)
+        with quiet(args):
+            cliper.edit_articles(notion.query_url)
+        return report("WebCliper.edit_articles", workers, metrics)
+
+
+def quiet(args: argparse.Namespace):
+    if args.verbose:
+        return contextlib.nullcontext()
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def report(name: str, workers: int, metrics: Metrics) -> dict:
+    snapshot = metrics.snapshot()
+    written = metrics.counter("pages_total", result="written")
+    elapsed = snapshot["elapsed_seconds"]
+    result = {
+        "benchmark": name,
+        "workers": workers,
+        "pages": metrics.counter("pages_total"),
+        "written": written,
+        "elapsed_seconds": elapsed,
+        "pages_per_second": written / elapsed if elapsed else 0.0,
+        "retries": metrics.counter("retries_total"),
+        "glm_early_stops": metrics.counter("glm_early_stops_total"),
+        "llm_hedges": metrics.counter("llm_hedges_total"),
+        "ollama_tokens_per_second": (
+            metrics.counter("ollama_tokens_total", kind="completion") / elapsed if elapsed else 0.0
+        ),
+        "latency": {},
+    }
+    for metric in ("stage_seconds", "http_request_seconds", "glm_first_token_seconds",
+                   "ollama_request_seconds", "ollama_first_token_seconds"):
+        for entry in snapshot["histograms"].get(metric, []):
+            labels = entry["labels"]
+            if "stage" in labels:
+                label = labels["stage"]
+            elif "model" in labels:
+                label = f"{metric.split('_seconds')[0]} {labels['model']}"
+            else:
+                label = f"{labels['method']} {labels['endpoint'].split('/', 1)[-1]}"
+            result["latency"][label] = {"count": entry["count"], **entry["quantiles"]}
+    return result
+
+
+def print_result(result: dict) -> None:
+    print(f"\n== {result['benchmark']} workers={result['workers']} ==")
+    print(f"  页面 {result['pages']:g}，写入 {result['written']:g}，"
+          f"耗时 {result['elapsed_seconds']:.2f} 秒，"
+          f"{result['pages_per_second']:.2f} 页/秒，重试 {result['retries']:g} 次")
+    if result["llm_hedges"]:
+        print(f"  对冲请求 {result['llm_hedges']:g} 次")
+    if result["glm_early_stops"]:
+        print(f"  GLM 提前结束流式响应 {result['glm_early_stops']:g} 次")
+    if result["ollama_tokens_per_second"]:
+        print(f"  Ollama 总吞吐 {result['ollama_tokens_per_second']:.1f} tokens/秒")
+    for label, stats in result["latency"].items():
+        quantiles = " ".join(
+            f"p{int(float(q) * 100)}={value * 1000:.0f}ms"
+            for q, value in stats.items() if q != "count" and value is not None
+        )
+        print(f"  {label:<40} n={stats['count']:<5} {quantiles}")
+
+
+def main() -> int:
+    args = parse_args()
+    results: List[dict] = []
+    for workers in (int(level) for level in args.concurrency.split(",") if level.strip()):
+        results.append(bench_cliper(args, workers))
+        print_result(results[-1])
+
+    if not args.skip_webcliper:
+        # The ollama client reads OLLAMA_HOST once, when it is first imported.
+        ollama_behavior = Behavior(args.ollama_latency, args.ollama_jitter, seed=args.seed)
+        with FakeOllama(ollama_behavior, parallel=args.ollama_parallel) as ollama:
+            os.environ["OLLAMA_HOST"] = ollama.url
+            for workers in (int(level) for level in args.webcliper_concurrency.split(",")
+                            if level.strip()):
+                result = bench_webcliper(args, workers)
+                if result is None:
+                    break
+                results.append(result)
+                print_result(result)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
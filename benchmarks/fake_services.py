@@ -0,0 +1,553 @@
+"""In-process stand-ins for the Notion, GLM (chat and Batch) and Ollama HTTP APIs.
+
+Each server runs on a background thread on 127.0.0.1 and can be tuned with a
+``Behavior``: per-request latency with an optional slow tail, a server-side
+rate limit answered with 429
+and ``Retry-After``, and a fraction of requests failing with 500. The Notion
+server holds a generated dataset whose size is configurable. ``parallel``
+caps how many requests a server works on at once, like Ollama's
+``OLLAMA_NUM_PARALLEL``; the rest wait for a slot.
+"""
+import contextlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+CATEGORIES = ['软件开发', 'Python', '效率效能', '学习', '思维', '其他']
+
+
+class Stream(list):
+    """A payload streamed item by item with chunked encoding, ``interval`` seconds apart."""
+
+    content_type = "application/octet-stream"
+
+    def __init__(self, items=(), interval: float = 0.0) -> None:
+        super().__init__(items)
+        self.interval = interval
+
+    def format(self, item) -> str:
+        raise NotImplementedError
+
+
+class NdJson(Stream):
+    """Newline-delimited JSON objects, like a streamed Ollama reply."""
+
+    content_type = "application/x-ndjson"
+
+    def format(self, item) -> str:
+        return json.dumps(item, ensure_ascii=False) + "\n"
+
+
+class EventStream(Stream):
+    """Server-sent events, like a streamed OpenAI-style chat completion."""
+
+    content_type = "text/event-stream"
+
+    def format(self, item) -> str:
+        data = item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+        return f"data: {data}\n\n"
+
+
+class Behavior:
+    """How a fake server answers: latency, rate limit and error injection."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 rate_limit: Optional[float] = None, error_rate: float = 0.0,
+                 seed: Optional[int] = None, tail_rate: float = 0.0,
+                 tail_latency: float = 0.0) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        # A tail_rate fraction of requests takes tail_latency seconds longer.
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = rate_limit or 0.0
+        self._updated = time.monotonic()
+
+    def delay(self) -> float:
+        with self._lock:
+            delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            if self.tail_rate and self._random.random() < self.tail_rate:
+                delay += self.tail_latency
+            return max(0.0, delay)
+
+    def fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def throttle(self) -> Optional[int]:
+        """Seconds to put in ``Retry-After`` if this request exceeds the rate limit."""
+        if not self.rate_limit:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            capacity = max(1.0, self.rate_limit)
+            self._tokens = min(capacity, self._tokens + (now - self._updated) * self.rate_limit)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return None
+            return max(1, math.ceil((1 - self._tokens) / self.rate_limit))
+
+
+class FakeServer:
+    """Base class: a threaded HTTP server dispatching to ``handle``."""
+
+    def __init__(self, behavior: Optional[Behavior] = None,
+                 parallel: Optional[int] = None) -> None:
+        self.behavior = behavior or Behavior()
+        self._slots = (threading.BoundedSemaphore(parallel) if parallel
+                       else contextlib.nullcontext())
+        self.requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._dispatch(self, "GET")
+
+            def do_POST(self):
+                server._dispatch(self, "POST")
+
+            def do_PATCH(self):
+                server._dispatch(self, "PATCH")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 256
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return self.requests.get(name, 0)
+
+    def handle(self, method: str, path: str, query: dict, body) -> Tuple[int, object]:
+        raise NotImplementedError
+
+    def _dispatch(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        length = int(handler.headers.get("Content-Length") or 0)
+        raw = handler.rfile.read(length) if length else b""
+        parts = urlsplit(handler.path)
+        with self._slots:
+            time.sleep(self.behavior.delay())
+
+        headers = {}
+        retry_after = self.behavior.throttle()
+        if retry_after is not None:
+            status, payload = 429, {"object": "error", "code": "rate_limited"}
+            headers["Retry-After"] = str(retry_after)
+        elif self.behavior.fail():
+            status, payload = 500, {"object": "error", "code": "internal_server_error"}
+        else:
+            if handler.headers.get("Content-Type", "").startswith("multipart/"):
+                body = raw
+            else:
+                try:
+                    body = json.loads(raw) if raw else None
+                except json.JSONDecodeError:
+                    body = None
+            status, payload = self.handle(method, parts.path, parse_qs(parts.query), body)
+        with self._lock:
+            key = f"{method} {status}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+        if isinstance(payload, Stream):
+            self._write_stream(handler, status, payload)
+            return
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    @staticmethod
+    def _write_stream(handler: BaseHTTPRequestHandler, status: int, payload: Stream) -> None:
+        handler.send_response(status)
+        handler.send_header("Content-Type", payload.content_type)
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        try:
+            for item in payload:
+                time.sleep(payload.interval)
+                data = payload.format(item).encode("utf-8")
+                handler.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                handler.wfile.flush()
+            handler.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading early, as streaming clients may.
+            handler.close_connection = True
+
+
+def _rich_text(content: str) -> List[dict]:
+    return [{"type": "text", "text": {"content": content, "link": None}, "plain_text": content}]
+
+
+class FakeNotion(FakeServer):
+    """Notion database query, page and block-children endpoints over a generated dataset.
+
+    Every page starts unprocessed (``updated`` and ``marked`` unchecked) with a
+    summary and ``blocks_per_page`` top-level blocks. With ``block_depth`` > 1
+    every fourth block is a toggle holding ``blocks_per_page`` nested blocks,
+    down to that depth. Only the filters and sorts used by this repository are
+    implemented.
+    """
+
+    def __init__(self, pages: int = 100, blocks_per_page: int = 20,
+                 behavior: Optional[Behavior] = None, block_depth: int = 1) -> None:
+        super().__init__(behavior)
+        self.database_id = uuid.uuid4().hex
+        self.blocks_per_page = blocks_per_page
+        self.block_depth = block_depth
+        self.pages: Dict[str, dict] = {}
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for index in range(pages):
+            page_id = str(uuid.uuid4())
+            self.pages[page_id] = {
+                "object": "page",
+                "id": page_id,
+                "last_edited_time": _timestamp(start + timedelta(minutes=index)),
+                "properties": {
+                    "Name": {"type": "title", "title": _rich_text(f"文章 {index}")},
+                    "summary": {"type": "rich_text",
+                                "rich_text": _rich_text(f"第 {index} 篇文章的摘要，介绍软件开发实践。")},
+                    "Tags": {"type": "rich_text", "rich_text": []},
+                    "labels": {"type": "multi_select", "multi_select": []},
+                    "Classfiy": {"type": "select", "select": None},
+                    "updated": {"type": "checkbox", "checkbox": False},
+                    "marked": {"type": "checkbox", "checkbox": False},
+                },
+            }
+
+    @property
+    def query_url(self) -> str:
+        return f"{self.url}/v1/databases/{self.database_id}/query"
+
+    def handle(self, method, path, query, body):
+        match = re.fullmatch(r"/v1/databases/([^/]+)/query", path)
+        if match and method == "POST":
+            return 200, self._query(body or {})
+        match = re.fullmatch(r"/v1/pages/([^/]+)", path)
+        if match and match.group(1) in self.pages:
+            page = self.pages[match.group(1)]
+            if method == "PATCH":
+                self._patch(page, (body or {}).get("properties") or {})
+            return 200, page
+        match = re.fullmatch(r"/v1/blocks/([^/]+)/children", path)
+        if match and method == "GET" and match.group(1).split(".")[0] in self.pages:
+            return 200, self._children(match.group(1), query)
+        return 404, {"object": "error", "code": "object_not_found"}
+
+    def _query(self, body: dict) -> dict:
+        with self._lock:
+            pages = [page for page in self.pages.values() if _matches(page, body.get("filter"))]
+        for sort in reversed(body.get("sorts") or []):
+            if sort.get("timestamp") == "last_edited_time":
+                pages.sort(key=lambda page: page["last_edited_time"],
+                           reverse=sort.get("direction") == "descending")
+        return _paginate(pages, body.get("start_cursor"), body.get("page_size"))
+
+    def _patch(self, page: dict, properties: dict) -> None:
+        with self._lock:
+            for name, value in properties.items():
+                page["properties"][name] = value
+            page["last_edited_time"] = _timestamp(datetime.now(timezone.utc))
+
+    def _children(self, parent_id: str, query: dict) -> dict:
+        # Block ids are the page id plus one ".<index>" per nesting level.
+        depth = parent_id.count(".") + 1
+        blocks = []
+        for index in range(self.blocks_per_page):
+            nested = depth < self.block_depth and index % 4 == 0
+            kind = "toggle" if nested else "paragraph"
+            blocks.append({
+                "object": "block",
+                "id": f"{parent_id}.{index}",
+                "type": kind,
+                "has_children": nested,
+                kind: {"rich_text": _rich_text(f"第 {depth}.{index} 段：关于软件开发和效率的内容。" * 5)},
+            })
+        cursor = (query.get("start_cursor") or [None])[0]
+        page_size = (query.get("page_size") or [None])[0]
+        return _paginate(blocks, cursor, int(page_size) if page_size else None)
+
+
+def _timestamp(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}Z"
+
+
+def _paginate(results: list, cursor: Optional[str], page_size: Optional[int]) -> dict:
+    start = int(cursor) if cursor else 0
+    size = min(int(page_size or 100), 100)
+    end = start + size
+    return {
+        "object": "list",
+        "results": results[start:end],
+        "has_more": end < len(results),
+        "next_cursor": str(end) if end < len(results) else None,
+    }
+
+
+def _matches(page: dict, condition: Optional[dict]) -> bool:
+    if not condition:
+        return True
+    if "and" in condition:
+        return all(_matches(page, part) for part in condition["and"])
+    if "or" in condition:
+        return any(_matches(page, part) for part in condition["or"])
+    if condition.get("timestamp") == "last_edited_time":
+        bound = condition["last_edited_time"]
+        if "on_or_after" in bound:
+            return page["last_edited_time"] >= bound["on_or_after"]
+        if "after" in bound:
+            return page["last_edited_time"] > bound["after"]
+        return True
+    prop = page["properties"].get(condition.get("property"), {})
+    if "checkbox" in condition:
+        return bool(prop.get("checkbox")) == condition["checkbox"].get("equals")
+    if "select" in condition:
+        selected = (prop.get("select") or {}).get("name")
+        if condition["select"].get("is_empty"):
+            return selected is None
+        return selected == condition["select"].get("equals")
+    return True
+
+
+class FakeGlm(FakeServer):
+    """GLM chat completion endpoint answering the prompts ``GlmAi`` sends.
+
+    Answers are produced four characters per ``token_interval`` seconds, and
+    ``chatter`` adds that many chunks of commentary after the answer, as
+    models often do. Requests with ``"stream": true`` get server-sent events.
+    """
+
+    path = "/api/paas/v4/chat/completions"
+
+    def __init__(self, behavior: Optional[Behavior] = None, parallel: Optional[int] = None,
+                 token_interval: float = 0.0, chatter: int = 0) -> None:
+        super().__init__(behavior, parallel)
+        self.token_interval = token_interval
+        self.chatter = chatter
+
+    @property
+    def chat_url(self) -> str:
+        return f"{self.url}{self.path}"
+
+    def handle(self, method, path, query, body):
+        if method != "POST" or path != self.path:
+            return 404, {"error": {"code": "404", "message": "not found"}}
+        body = body or {}
+        messages = body.get("messages") or []
+        system = messages[0]["content"] if messages else ""
+        prompt = messages[-1]["content"] if messages else ""
+        pieces = self.pieces(self.answer(system, prompt))
+        content = "".join(pieces)
+        usage = {"prompt_tokens": len(prompt), "completion_tokens": len(content),
+                 "total_tokens": len(prompt) + len(content)}
+        completion_id = uuid.uuid4().hex
+        if body.get("stream"):
+            events = EventStream((
+                {"id": completion_id, "model": body.get("model"),
+                 "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}}]}
+                for piece in pieces
+            ), interval=self.token_interval)
+            events.append({"id": completion_id, "model": body.get("model"),
+                           "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}],
+                           "usage": usage})
+            events.append("[DONE]")
+            return 200, events
+        time.sleep(self.token_interval * len(pieces))
+        return 200, {
+            "id": completion_id,
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        }
+
+    def pieces(self, answer: str) -> List[str]:
+        pieces = [answer[start:start + 4] for start in range(0, len(answer), 4)]
+        if self.chatter:
+            pieces.append("\n\n")
+            pieces.extend(["补充说明：这是根据内容给出的结果。"] * self.chatter)
+        return pieces
+
+    @staticmethod
+    def answer(system: str, prompt: str) -> str:
+        category = random.choice(CATEGORIES)
+        if "JSON 数组" in system:
+            ids = re.findall(r"^\[(\d+)\]", prompt, re.MULTILINE)
+            return json.dumps([{"id": int(i), "category": category} for i in ids],
+                              ensure_ascii=False)
+        if "只返回一个分类名称" in system:
+            return category
+        result = {"summary": "这是一段自动生成的摘要。", "tags": ["软件开发", "效率"]}
+        if "分类" in system:
+            result["category"] = category
+        return "```json\n" + json.dumps(result, ensure_ascii=False) + "\n```"
+
+
+class FakeGlmBatch(FakeServer):
+    """GLM Batch API: ``/files`` uploads and downloads plus ``/batches``.
+
+    A created batch reports ``in_progress`` on its first status poll and is
+    ``completed`` from the second on, with an output file answering every
+    request like ``FakeGlm``. The first ``failures`` requests of each batch
+    get an error record instead.
+    """
+
+    prefix = "/api/paas/v4"
+
+    def __init__(self, behavior: Optional[Behavior] = None, failures: int = 0) -> None:
+        super().__init__(behavior)
+        self.failures = failures
+        self.files: Dict[str, List[dict]] = {}
+        self.batches: Dict[str, dict] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}{self.prefix}"
+
+    def handle(self, method, path, query, body):
+        path = path[len(self.prefix):] if path.startswith(self.prefix) else path
+        if method == "POST" and path == "/files" and isinstance(body, bytes):
+            return 200, self._upload(body)
+        match = re.fullmatch(r"/files/([^/]+)/content", path)
+        if method == "GET" and match and match.group(1) in self.files:
+            return 200, NdJson(self.files[match.group(1)])
+        if method == "POST" and path == "/batches" and (body or {}).get("input_file_id") in self.files:
+            return 200, self._create(body)
+        match = re.fullmatch(r"/batches/([^/]+)", path)
+        if method == "GET" and match and match.group(1) in self.batches:
+            return 200, self._retrieve(match.group(1))
+        return 404, {"error": {"code": "404", "message": "not found"}}
+
+    def _upload(self, body: bytes) -> dict:
+        # The file part is the last one: its content runs from the blank line
+        # after its headers to the closing boundary.
+        boundary = body[:body.index(b"\r\n")]
+        part = body.split(boundary)[-2]
+        content = part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0]
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self._lock:
+            self.files[file_id] = [json.loads(line) for line in content.decode("utf-8").splitlines()
+                                   if line.strip()]
+        return {"id": file_id, "object": "file", "purpose": "batch"}
+
+    def _create(self, body: dict) -> dict:
+        batch_id = f"batch-{uuid.uuid4().hex}"
+        lines = self.files[body["input_file_id"]]
+        results = []
+        for index, request in enumerate(lines):
+            if index < self.failures:
+                results.append({"custom_id": request["custom_id"],
+                                "response": {"status_code": 500, "body": {}},
+                                "error": {"code": "500", "message": "internal error"}})
+                continue
+            messages = request["body"]["messages"]
+            content = FakeGlm.answer(messages[0]["content"], messages[-1]["content"])
+            results.append({"custom_id": request["custom_id"], "response": {
+                "status_code": 200,
+                "body": {"choices": [{"index": 0, "finish_reason": "stop",
+                                      "message": {"role": "assistant", "content": content}}]},
+            }})
+        output_file_id = f"file-{uuid.uuid4().hex}"
+        with self._lock:
+            self.files[output_file_id] = results
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "status": "validating", "polls": 0,
+                "input_file_id": body["input_file_id"], "output_file_id": output_file_id,
+                "request_counts": {"total": len(lines), "completed": len(lines) - self.failures,
+                                   "failed": min(self.failures, len(lines))},
+            }
+            return self._public(self.batches[batch_id])
+
+    def _retrieve(self, batch_id: str) -> dict:
+        with self._lock:
+            batch = self.batches[batch_id]
+            batch["polls"] += 1
+            batch["status"] = "completed" if batch["polls"] > 1 else "in_progress"
+            return self._public(batch)
+
+    @staticmethod
+    def _public(batch: dict) -> dict:
+        public = {key: value for key, value in batch.items() if key != "polls"}
+        if public["status"] != "completed":
+            public.pop("output_file_id")
+        return public
+
+
+class FakeOllama(FakeServer):
+    """Ollama ``/api/generate`` endpoint answering the prompts ``SummaryAi`` sends.
+
+    Streamed requests get the reply in a few chunks followed by a ``done``
+    chunk carrying the token counts and durations Ollama reports.
+    """
+
+    def handle(self, method, path, query, body):
+        if method != "POST" or path != "/api/generate":
+            return 404, {"error": "not found"}
+        body = body or {}
+        prompt = body.get("prompt", "")
+        if not prompt:
+            # Loading or unloading the model.
+            response = ""
+        elif "分类" in prompt and "json" not in prompt:
+            response = random.choice(CATEGORIES)
+        else:
+            response = json.dumps({"summary": "这是一段自动生成的摘要。", "tags": ["软件开发", "效率"]},
+                                  ensure_ascii=False)
+        created_at = _timestamp(datetime.now(timezone.utc))
+        final = {
+            "model": body.get("model"),
+            "created_at": created_at,
+            "response": response,
+            "done": True,
+            "prompt_eval_count": len(prompt),
+            "eval_count": len(response),
+            "eval_duration": int(self.behavior.latency * 1e9),
+        }
+        if not body.get("stream", True):
+            return 200, final
+        pieces = [response[start:start + 8] for start in range(0, len(response), 8)]
+        chunks = NdJson({"model": body.get("model"), "created_at": created_at,
+                         "response": piece, "done": False} for piece in pieces)
+        chunks.append({**final, "response": ""})
+        return 200, chunks
@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+STAGES = ("fetched", "tagged", "classified", "written")
+
+
+class CheckpointJournal:
+    """Append-only JSONL journal of how far each page got through processing.
+
+    Every record is flushed and fsynced before ``record`` returns, so after a
+    crash the journal reflects all completed stages. Loading merges the records
+    of a page into one state dict holding the furthest stage reached and the
+    data recorded along the way (tags, summary, category). ``restart`` drops
+    what a page reached so far, e.g. when its input changed.
+    """
+
+    def __init__(self, path: str, resume: bool = True) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._states: Dict[str, dict] = {}
+        if resume:
+            self._load()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                # A torn final line from a crash mid-write: cut it off so the
+                # next record starts on a line of its own. Its stage is redone.
+                f.truncate(end)
+        for line in data[:end].decode("utf-8", errors="replace").splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self._apply(record)
+
+    def _apply(self, record: dict) -> None:
+        page_id = record.get("page_id")
+        stage = record.get("stage")
+        if not page_id or stage not in STAGES:
+            return
+        if record.get("restart"):
+            self._states.pop(page_id, None)
+        state = self._states.setdefault(page_id, {"stage": stage})
+        if STAGES.index(stage) >= STAGES.index(state["stage"]):
+            state["stage"] = stage
+        state.update(record.get("data") or {})
+
+    def record(self, page_id: str, stage: str, **data) -> None:
+        if stage not in STAGES:
+            raise ValueError(f"unknown stage: {stage}")
+        record = {"page_id": page_id, "stage": stage, "ts": time.time()}
+        if data:
+            record["data"] = data
+        self._write(record)
+
+    def restart(self, page_id: str, **data) -> None:
+        """Start the page over at ``fetched``, forgetting its earlier stages and data."""
+        self._write({"page_id": page_id, "stage": "fetched", "restart": True,
+                     "ts": time.time(), "data": data})
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._apply(record)
+
+    def state(self, page_id: str) -> Optional[dict]:
+        with self._lock:
+            state = self._states.get(page_id)
+            return dict(state) if state else None
+
+    def reached(self, page_id: str, stage: str) -> bool:
+        state = self.state(page_id)
+        return bool(state) and STAGES.index(state["stage"]) >= STAGES.index(stage)
+
+    def compact(self) -> int:
+        """Rewrite the journal as one merged record per page; returns the page count."""
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for page_id, state in self._states.items():
+                    data = {key: value for key, value in state.items() if key != "stage"}
+                    record = {"page_id": page_id, "stage": state["stage"], "ts": time.time()}
+                    if data:
+                        record["data"] = data
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+            return len(self._states)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
@@ -1,16 +1,46 @@
 import json
 import os
 import re
-import time
-from typing import Optional
+import threading
+from concurrent.futures import FIRST_COMPLETED, FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 import custom_requests as requests
 
+from checkpoint import CheckpointJournal
 from glm_ai import GlmAi
+from glm_batch import GlmBatchClient, iter_batch_results, result_content
+from llm_cache import LlmCache
+from metrics import Metrics
+from mirror import NotionMirror
+from notion_api import (
+    NOTION_MAX_PAGE_SIZE, iter_query_batches, iter_query_pages, notion_base_url,
+    notion_retry_policy, page_gone,
+)
+from search_index import SearchIndex
+from sync_state import SyncState, WatermarkTracker, content_hash, incremental_query
 
 
 class Cliper:
-    def __init__(self, env_file: Optional[str] = ".env"):
+    def __init__(
+        self,
+        env_file: Optional[str] = ".env",
+        run_timeout: Optional[float] = None,
+        workers: int = 1,
+        glm_concurrency: Optional[int] = None,
+        notion_concurrency: int = 3,
+        cache_path: Optional[str] = None,
+        combined_analysis: bool = True,
+        batch_classify: bool = False,
+        classify_token_budget: int = 4000,
+        journal: Optional[CheckpointJournal] = None,
+        metrics: Optional[Metrics] = None,
+        notion_url: Optional[str] = None,
+        mirror: Optional[NotionMirror] = None,
+        search_index: Optional[SearchIndex] = None,
+        stream: bool = False,
+        llm_backend: Optional[Callable[[List[dict], Optional[str]], Tuple[str, str]]] = None,
+    ):
         notion_token = os.environ.get("NOTION_TOKEN")
         if not notion_token:
             raise ValueError("NOTION_TOKEN environment variable is required")
@@ -19,7 +49,24 @@ class Cliper:
             "Notion-Version": "2022-02-22",
             "Content-Type": "application/json",
         }
-        self.ai = GlmAi(env_file=env_file)
+        self.notion_url = notion_base_url(notion_url)
+        # Latency of every request and processing stage, retries and page counts.
+        self.metrics = metrics or Metrics()
+        self.session = requests.Session(
+            headers=self.headers,
+            retry=notion_retry_policy(on_retry=self._log_retry, run_timeout=run_timeout),
+            on_request=self.metrics.observe_http,
+        )
+        self.cache = LlmCache(cache_path) if cache_path else None
+        self.ai = GlmAi(env_file=env_file, run_timeout=run_timeout, cache=self.cache,
+                        metrics=self.metrics, stream=stream, backend=llm_backend)
+        # Records each page's progress so an interrupted run can resume without
+        # repeating GLM calls or PATCHes.
+        self.journal = journal
+        # Local copy of the database used to select pending pages.
+        self.mirror = mirror
+        # Full-text index refreshed with each page's written properties.
+        self.search_index = search_index
         self.categories = [
             '区块链', 'ChatGPT', 'SEO', 'Web3', 'Web开发', '编程语言', '餐饮', '产品开发', '创业',
             '独立开发', '个人管理', '公开课', '管理', '家庭', '健康', '经济学', '开源软件', '历史',
@@ -30,9 +77,127 @@ class Cliper:
             '阅读', '自然科学', '科普', '生命科学', '其他', '艺术', 'Python', 'Golang', 'PHP', 'Nodejs',
             'JavaScript', 'Vue', 'React', 'Nextjs'
         ]
+        # Ask GLM for summary, tags and category in one completion instead of two.
+        self.combined_analysis = combined_analysis
+        # Alternatively classify each query batch with a few multi-page prompts.
+        self.batch_classify = batch_classify
+        self.classify_token_budget = classify_token_budget
+        # With workers > 1 pages are processed by a thread pool; each downstream
+        # service additionally gets its own cap on in-flight requests.
+        self.workers = max(1, workers)
+        self._glm_slots = threading.BoundedSemaphore(glm_concurrency or self.workers)
+        self._notion_slots = threading.BoundedSemaphore(max(1, notion_concurrency))
 
     def update_web_clips(self, url, next_cursor=None):
-        params = {
+        batches = self._query_batches(url, self._pending_query(), next_cursor)
+        if self.batch_classify:
+            count = 0
+            for batch in batches:
+                count += len(batch)
+                self._process_batch(batch)
+        else:
+            count = self._process_pages(page for batch in batches for page in batch)
+        if not count:
+            print('没有可处理的记录')
+
+    def _query_batches(self, url, query: dict, next_cursor=None) -> Iterable[List[dict]]:
+        """Batches of pages matching ``query``, from the mirror when one is configured."""
+        def fetch(body):
+            return self._request_json(url, body, method="POST")
+
+        if self.mirror is None or next_cursor:
+            return iter_query_batches(fetch, query, next_cursor)
+        synced = self.mirror.sync(url, fetch)
+        print(f"本地镜像已同步 {synced} 条记录")
+        pages = self.mirror.query(url, query.get('filter'))
+        return (pages[start:start + NOTION_MAX_PAGE_SIZE]
+                for start in range(0, len(pages), NOTION_MAX_PAGE_SIZE))
+
+    def sync_web_clips(self, url, state: SyncState) -> int:
+        """Process pages edited since the last sync whose summary changed.
+
+        Pages are queried by ``last_edited_time`` from the stored high-water
+        mark onward, so the query cost follows the change rate rather than the
+        database size. The ``updated`` flag is ignored: an already tagged page
+        is redone when its summary hash differs from the one last processed.
+        """
+        scope = f"cliper:{url}"
+        tracker = WatermarkTracker(state.watermark(scope))
+
+        def fetch(body):
+            return self._request_json(url, body, method="POST")
+
+        def sync(page):
+            summary_text = self._get_summary_text(page)
+            digest = content_hash(summary_text)
+            known = state.content_hash(scope, page['id'])
+            ok = True
+            if known == digest:
+                print(f"{self._get_page_name(page)} summary 未变化，跳过")
+                self.metrics.inc('pages_total', result='unchanged')
+            elif known is None and self._is_marked_updated(page):
+                # Tagged before incremental sync was used: take it as the baseline.
+                state.set_content_hash(scope, page['id'], digest)
+            else:
+                self._journal_restart(page['id'], digest)
+                ok = self._process_page(page, force=True)
+                if ok:
+                    state.set_content_hash(scope, page['id'], digest)
+            tracker.seen(page.get('last_edited_time'), ok)
+
+        count = self._run_all(sync, iter_query_pages(fetch, incremental_query(tracker.value)))
+        if tracker.value:
+            state.set_watermark(scope, tracker.value)
+        if not count:
+            print('没有可处理的记录')
+        return count
+
+    def export_batch_requests(self, url, path: str, client: GlmBatchClient,
+                              next_cursor=None) -> int:
+        """Write one chat-completion request per unprocessed page to a JSONL batch file."""
+        count = 0
+        with open(path, 'w', encoding='utf-8') as f:
+            for batch in self._query_batches(url, self._pending_query(), next_cursor):
+                for page in batch:
+                    summary_text = self._get_page_input(page)
+                    if summary_text is None:
+                        continue
+                    messages = self.ai.analyze_messages(summary_text, self.categories)
+                    f.write(client.request_line(page['id'], self.ai.chat_payload(messages)) + '\n')
+                    count += 1
+        return count
+
+    def apply_batch_results(self, path: str) -> int:
+        """Write the tags and categories of a downloaded batch output file to Notion.
+
+        Returns the number of pages written.
+        """
+        written = []
+
+        def apply(record):
+            page_id = record.get('custom_id')
+            if self.journal is not None and self.journal.reached(page_id, 'written'):
+                return
+            content = result_content(record)
+            if content is None:
+                print(f"{page_id} 批处理请求失败: {record.get('error') or record.get('response')}")
+                return
+            try:
+                result = self.ai.parse_analysis(content)
+            except ValueError as exc:
+                print(f"{page_id} 批处理结果无法解析: {exc}")
+                return
+            tags, _ = self._normalize_tags_and_summary(result, '')
+            classify = self._normalize_category(result.get('category'))
+            if self._write_result(page_id, page_id, tags, classify):
+                written.append(page_id)
+
+        self._run_all(apply, iter_batch_results(path))
+        return len(written)
+
+    @staticmethod
+    def _pending_query() -> dict:
+        return {
             "filter": {
                 "property": "updated",
                 "checkbox": {
@@ -40,23 +205,45 @@ class Cliper:
                 }
             }
         }
-        if next_cursor:
-            params['start_cursor'] = next_cursor
 
-        payload = self._request_json(url, params, method="POST")
-        results = payload.get('results', [])
-        if not results:
-            print('没有可处理的记录')
-            return
+    def _process_pages(self, pages: Iterable[dict]) -> int:
+        return self._run_all(self._process_page, pages)
 
-        for page in results:
-            self._process_page(page)
+    def _run_all(self, func: Callable[[dict], None], items: Iterable[dict]) -> int:
+        count = 0
+        if self.workers == 1:
+            for item in items:
+                count += 1
+                func(item)
+            return count
 
-        if payload.get('has_more'):
-            self.update_web_clips(url, payload.get('next_cursor'))
+        # Keep a bounded number of pages queued so the pool stays busy across
+        # query batches without reading the whole database ahead.
+        max_pending = self.workers * 2
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            try:
+                for item in items:
+                    count += 1
+                    pending.add(executor.submit(func, item))
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._raise_failures(done)
+                done, pending = wait(pending, return_when=FIRST_EXCEPTION)
+                self._raise_failures(done)
+            finally:
+                for future in pending:
+                    future.cancel()
+        return count
+
+    @staticmethod
+    def _raise_failures(done) -> None:
+        for future in done:
+            if future.exception() is not None:
+                raise future.exception()
 
     def update_single_clip(self, page_id: str):
-        page_url = f"https://api.notion.com/v1/pages/{page_id}"
+        page_url = f"{self.notion_url}/pages/{page_id}"
         page = self._request_json(page_url, method="GET")
         if not page:
             print('未获取到页面信息')
@@ -80,11 +267,14 @@ class Cliper:
 
     def _generate_tags_and_summary(self, summary_text):
         try:
-            result = self.ai.generate_summary_and_tags(summary_text)
+            with self.metrics.timer('stage_seconds', stage='tags'), self._glm_slots:
+                result = self.ai.generate_summary_and_tags(summary_text)
         except ValueError as exc:
             print(f"GLM 生成标签失败: {exc}")
             return [], summary_text
+        return self._normalize_tags_and_summary(result, summary_text)
 
+    def _normalize_tags_and_summary(self, result, summary_text):
         tags = result.get('tags') if isinstance(result, dict) else []
         if not isinstance(tags, list):
             tags = []
@@ -100,19 +290,73 @@ class Cliper:
 
     def _generate_classify(self, summary_text, tags):
         try:
-            result = self.ai.classify(summary_text, tags, self.categories)
+            with self.metrics.timer('stage_seconds', stage='classify'), self._glm_slots:
+                result = self.ai.classify(summary_text, tags, self.categories)
         except ValueError as exc:
             print(f"GLM 分类失败: {exc}")
             return ''
+        return self._normalize_category(result)
+
+    def _generate_classify_batch(self, items: List[dict]) -> Dict[str, str]:
+        answers: Dict[str, str] = {}
 
+        def classify_group(group):
+            try:
+                with self.metrics.timer('stage_seconds', stage='classify_batch'), self._glm_slots:
+                    answers.update(self.ai.classify_batch(group, self.categories))
+            except ValueError as exc:
+                print(f"GLM 批量分类失败: {exc}")
+
+        groups = self.ai.pack_classify_batches(items, self.categories, self.classify_token_budget)
+        self._run_all(classify_group, groups)
+
+        categories: Dict[str, str] = {}
+        fallbacks = []
+        for item in items:
+            category = self._clean_category(answers.get(item['id'], ''))
+            if category in self.categories:
+                categories[item['id']] = category
+            else:
+                fallbacks.append(item)
+        if fallbacks:
+            print(f"{len(fallbacks)} 条记录批量分类无效，改为逐条分类")
+
+        def classify_single(item):
+            categories[item['id']] = self._generate_classify(item['summary'], item['tags'])
+
+        self._run_all(classify_single, fallbacks)
+        return categories
+
+    @staticmethod
+    def _clean_category(result):
+        if not isinstance(result, str):
+            return ''
         result = re.sub(r'分类名称：|分类：|分类为：|分类为:|分类:|分类名称:', '', result)
-        result = result.strip()
+        return result.strip()
+
+    def _normalize_category(self, result):
+        result = self._clean_category(result)
         if not result:
             return ''
         if result not in self.categories:
             return '其他'
         return result
 
+    def _generate_analysis(self, summary_text):
+        try:
+            with self.metrics.timer('stage_seconds', stage='analyze'), self._glm_slots:
+                result = self.ai.analyze(summary_text, self.categories)
+        except ValueError as exc:
+            print(f"GLM 综合分析失败，改为分步生成: {exc}")
+            tags, summary = self._generate_tags_and_summary(summary_text)
+            return tags, summary, self._generate_classify(summary, tags)
+
+        tags, summary = self._normalize_tags_and_summary(result, summary_text)
+        classify = self._normalize_category(result.get('category'))
+        if not classify:
+            classify = self._generate_classify(summary, tags)
+        return tags, summary, classify
+
     def _update_page(self, page_id, tags, classify):
         properties = {}
         if tags:
@@ -149,65 +393,184 @@ class Cliper:
         }
 
         data = {"properties": properties}
-        url = f"https://api.notion.com/v1/pages/{page_id}"
-        self._request_json(url, data, method="PATCH")
+        url = f"{self.notion_url}/pages/{page_id}"
+        page = self._request_json(url, data, method="PATCH")
+        if self.mirror is not None:
+            self.mirror.upsert(page)
+        if self.search_index is not None:
+            self.search_index.index_page(page)
 
     def _request_json(self, url: str, payload: Optional[dict] = None, method: str = "POST") -> dict:
         method = method.upper()
         headers = self.headers.copy()
         data = payload if payload is not None else {}
 
-        attempt = 0
-        while True:
-            attempt += 1
-            try:
+        try:
+            with self._notion_slots, self.metrics.timer('notion_request_seconds', method=method):
                 if method == "GET":
-                    response = requests.get(url, headers=headers, timeout=60)
+                    response = self.session.get(url, headers=headers, timeout=60)
                 elif method == "PATCH":
-                    response = requests.patch(url, headers=headers, json=data, timeout=60)
+                    response = self.session.patch(url, headers=headers, json=data, timeout=60)
                 else:
-                    response = requests.post(url, headers=headers, json=data, timeout=60)
-                response.raise_for_status()
-                body = response.text
-                if not body:
-                    return {}
-                return json.loads(body)
-            except requests.HTTPError as exc:
-                resp = exc.response
-                detail = resp.text if resp else str(exc)
-                status = resp.status_code if resp else 'unknown'
-                print(f"请求URL: {url}")
-                print(f"请求数据: {data}")
-                print(f"响应状态: {status}")
-                print(f"响应内容: {detail}")
-                raise RuntimeError(f"Notion API 请求失败 {status}: {detail}") from exc
-            except requests.RequestException as exc:
-                reason = getattr(exc, 'reason', None) or str(exc)
-                message = str(reason)
-                wait_time = min(5, attempt)
-                print(f"请求异常({message})，第 {attempt} 次重试，等待 {wait_time} 秒")
-                time.sleep(wait_time)
-                continue
-
-    def _process_page(self, page: dict) -> None:
+                    response = self.session.post(url, headers=headers, json=data, timeout=60)
+            body = response.text
+            if not body:
+                return {}
+            return json.loads(body)
+        except requests.HTTPError as exc:
+            resp = exc.response
+            detail = resp.text if resp else str(exc)
+            status = resp.status_code if resp else 'unknown'
+            print(f"请求URL: {url}")
+            print(f"请求数据: {data}")
+            print(f"响应状态: {status}")
+            print(f"响应内容: {detail}")
+            raise RuntimeError(f"Notion API 请求失败 {status}: {detail}") from exc
+        except requests.RequestException as exc:
+            reason = getattr(exc, 'reason', None) or str(exc)
+            raise RuntimeError(f"Notion API 请求失败: {reason}") from exc
+
+    def _log_retry(self, attempt: int, wait_time: float, exc: requests.RequestException) -> None:
+        self.metrics.inc('retries_total', service='notion')
+        if isinstance(exc, requests.HTTPError):
+            message = f"HTTP {exc.response.status_code}"
+        else:
+            message = str(getattr(exc, 'reason', None) or exc)
+        print(f"请求异常({message})，第 {attempt} 次重试，等待 {wait_time:.1f} 秒")
+
+    def _process_page(self, page: dict, force: bool = False) -> bool:
+        """Tag and classify one page; returns False if generation failed."""
+        with self.metrics.timer('stage_seconds', stage='page'):
+            return self._process_page_stages(page, force)
+
+    def _process_page_stages(self, page: dict, force: bool) -> bool:
+        summary_text = self._get_page_input(page, force)
+        if summary_text is None:
+            return True
+
+        page_id = page['id']
+        state = self._journal_state(page_id)
+        if 'tags' in state:
+            tags, summary = state['tags'], state['summary']
+            classify = state.get('category')
+            if classify is None:
+                classify = self._generate_classify(summary, tags)
+                self._journal_classified(page_id, classify)
+        elif self.combined_analysis:
+            tags, summary, classify = self._generate_analysis(summary_text)
+            self._journal_tagged(page_id, tags, summary)
+            self._journal_classified(page_id, classify)
+        else:
+            tags, summary = self._generate_tags_and_summary(summary_text)
+            self._journal_tagged(page_id, tags, summary)
+            classify = self._generate_classify(summary, tags)
+            self._journal_classified(page_id, classify)
+
+        return self._write_result(page_id, self._get_page_name(page), tags, classify)
+
+    def _process_batch(self, pages: List[dict]) -> None:
+        prepared = []
+
+        def tag(page):
+            summary_text = self._get_page_input(page)
+            if summary_text is None:
+                return
+            state = self._journal_state(page['id'])
+            if 'tags' in state:
+                tags, summary = state['tags'], state['summary']
+            else:
+                tags, summary = self._generate_tags_and_summary(summary_text)
+                self._journal_tagged(page['id'], tags, summary)
+            prepared.append({
+                'id': page['id'], 'page': page, 'tags': tags, 'summary': summary,
+                'category': state.get('category'),
+            })
+
+        self._run_all(tag, pages)
+        categories = {item['id']: item['category'] for item in prepared if item['category']}
+        classified = self._generate_classify_batch(
+            [item for item in prepared if not item['category']]
+        )
+        for page_id, classify in classified.items():
+            self._journal_classified(page_id, classify)
+        categories.update(classified)
+        self._run_all(
+            lambda item: self._write_result(
+                item['id'], self._get_page_name(item['page']), item['tags'],
+                categories.get(item['id'], ''),
+            ),
+            prepared,
+        )
+
+    def _get_page_input(self, page: dict, force: bool = False) -> Optional[str]:
         name = self._get_page_name(page)
-        if self._is_marked_updated(page):
+        if not force and self._is_marked_updated(page):
             print(f"{name} 已更新过，跳过")
-            return
+            self.metrics.inc('pages_total', result='skipped')
+            return None
+        if self.journal is not None:
+            if self.journal.reached(page['id'], 'written'):
+                print(f"{name} 已在之前的运行中更新，跳过")
+                self.metrics.inc('pages_total', result='skipped')
+                return None
+            if self.journal.state(page['id']) is None:
+                self.journal.record(page['id'], 'fetched')
         summary_text = self._get_summary_text(page)
         if not summary_text:
             print(f"{name} 缺少 summary，跳过")
-            return
-
-        tags, summary = self._generate_tags_and_summary(summary_text)
-        classify = self._generate_classify(summary, tags)
+            self.metrics.inc('pages_total', result='skipped')
+            return None
+        return summary_text
 
+    def _write_result(self, page_id: str, name: str, tags, classify) -> bool:
+        """Write tags and category to the page; returns whether it was written."""
         if not tags and not classify:
             print(f"{name} 生成标签和分类失败，跳过")
-            return
+            self.metrics.inc('pages_total', result='failed')
+            return False
 
         print(f"更新 {name} 的标签和分类")
-        self._update_page(page['id'], tags, classify)
+        try:
+            with self.metrics.timer('stage_seconds', stage='write'):
+                self._update_page(page_id, tags, classify)
+        except RuntimeError as exc:
+            if not page_gone(exc):
+                raise
+            # Deleted since it was mirrored; nothing is left to update.
+            self._forget_page(page_id)
+            print(f"{name} 已在 Notion 中删除，跳过")
+            self.metrics.inc('pages_total', result='deleted')
+            return False
+        if self.journal is not None:
+            self.journal.record(page_id, 'written')
+        self.metrics.inc('pages_total', result='written')
+        return True
+
+    def _forget_page(self, page_id: str) -> None:
+        if self.mirror is not None:
+            self.mirror.remove(page_id)
+        if self.search_index is not None:
+            self.search_index.remove(page_id)
+
+    def _journal_state(self, page_id: str) -> dict:
+        if self.journal is None:
+            return {}
+        return self.journal.state(page_id) or {}
+
+    def _journal_restart(self, page_id: str, digest: str) -> None:
+        # Tags and writes journaled for an older summary are stale; those of
+        # this summary are still good when resuming an interrupted sync.
+        if self.journal is not None and self._journal_state(page_id).get('summary_hash') != digest:
+            self.journal.restart(page_id, summary_hash=digest)
+
+    def _journal_tagged(self, page_id: str, tags, summary) -> None:
+        # Failed generations are not journaled so that a resumed run retries them.
+        if self.journal is not None and tags:
+            self.journal.record(page_id, 'tagged', tags=tags, summary=summary)
+
+    def _journal_classified(self, page_id: str, classify) -> None:
+        if self.journal is not None and classify:
+            self.journal.record(page_id, 'classified', category=classify)
 
     def _is_marked_updated(self, page: dict) -> bool:
         properties = page.get('properties', {}) if isinstance(page, dict) else {}
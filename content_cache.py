@@ -0,0 +1,161 @@
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import List, Optional
+
+
+class ContentCache:
+    """On-disk cache of extracted page text, keyed by page id and ``last_edited_time``.
+
+    Texts are zlib-compressed and appended to a single data file that is read
+    through a memory map; a SQLite index maps each page to its latest entry.
+    An entry is only returned for the exact ``last_edited_time`` it was stored
+    under, so an edited page misses and is fetched again. When the data file
+    grows past ``max_bytes`` it is compacted down to the most recently used
+    entries, dropping superseded ones on the way. Compaction writes a new
+    generation of the data file and switches the index to it in one
+    transaction, so a crash leaves either the old or the new state.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(directory, "index.sqlite3"), check_same_thread=False,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " page_id TEXT PRIMARY KEY,"
+            " last_edited_time TEXT NOT NULL,"
+            " offset INTEGER NOT NULL,"
+            " length INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        self._generation = row[0] if row else 0
+        self._remove_stale_generations()
+        self._data = open(self._data_path(self._generation), "a+b")
+        self._map: Optional[mmap.mmap] = None
+
+    def _data_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"blocks.{generation}.dat")
+
+    def _remove_stale_generations(self) -> None:
+        current = os.path.basename(self._data_path(self._generation))
+        for name in os.listdir(self.directory):
+            if name.startswith("blocks.") and name.endswith(".dat") and name != current:
+                os.remove(os.path.join(self.directory, name))
+
+    def get(self, page_id: str, last_edited_time: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT offset, length FROM entries WHERE page_id = ? AND last_edited_time = ?",
+                (page_id, last_edited_time),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            offset, length = row
+            data = self._view(offset + length)[offset:offset + length]
+            try:
+                blocks = json.loads(zlib.decompress(data).decode("utf-8"))
+            except (zlib.error, ValueError):
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_used = ? WHERE page_id = ?", (time.time(), page_id)
+            )
+            self.hits += 1
+        return blocks
+
+    def set(self, page_id: str, last_edited_time: str, blocks: List[str]) -> None:
+        data = zlib.compress(json.dumps(blocks, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._data.seek(0, os.SEEK_END)
+            offset = self._data.tell()
+            self._data.write(data)
+            self._data.flush()
+            self._conn.execute(
+                "INSERT INTO entries (page_id, last_edited_time, offset, length, last_used)"
+                " VALUES (?, ?, ?, ?, ?) ON CONFLICT (page_id) DO UPDATE SET"
+                " last_edited_time = excluded.last_edited_time, offset = excluded.offset,"
+                " length = excluded.length, last_used = excluded.last_used",
+                (page_id, last_edited_time, offset, len(data), time.time()),
+            )
+            if offset + len(data) > self.max_bytes:
+                self._compact()
+
+    def rekey(self, page_id: str, old_time: str, new_time: str) -> None:
+        """Move an entry stored under ``old_time`` to ``new_time``, e.g. after a property-only PATCH."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE entries SET last_edited_time = ? WHERE page_id = ? AND last_edited_time = ?",
+                (new_time, page_id, old_time),
+            )
+
+    def _view(self, size: int) -> mmap.mmap:
+        # The data file only grows between compactions, so remap when it has.
+        if self._map is None or len(self._map) < size:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _compact(self) -> None:
+        rows = self._conn.execute(
+            "SELECT page_id, offset, length FROM entries ORDER BY last_used DESC"
+        ).fetchall()
+        view = self._view(max(offset + length for _, offset, length in rows))
+        target = int(self.max_bytes * 0.75)
+        generation = self._generation + 1
+        kept, dropped = [], []
+        with open(self._data_path(generation), "wb") as f:
+            for page_id, offset, length in rows:
+                if f.tell() + length > target:
+                    dropped.append((page_id,))
+                    continue
+                kept.append((f.tell(), page_id))
+                f.write(view[offset:offset + length])
+            f.flush()
+            os.fsync(f.fileno())
+        self._conn.execute("BEGIN")
+        self._conn.executemany("UPDATE entries SET offset = ? WHERE page_id = ?", kept)
+        self._conn.executemany("DELETE FROM entries WHERE page_id = ?", dropped)
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('generation', ?)"
+            " ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (generation,),
+        )
+        self._conn.execute("COMMIT")
+        self._map.close()
+        self._map = None
+        self._data.close()
+        self._generation = generation
+        self._remove_stale_generations()
+        self._data = open(self._data_path(generation), "a+b")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return {"hits": self.hits, "misses": self.misses, "entries": entries,
+                    "bytes": os.path.getsize(self._data_path(self._generation))}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            self._data.close()
+            self._conn.close()
@@ -1,6 +1,15 @@
+import functools as _functools
+import http.client as _http
 import json as _json
-from typing import Any, Dict, Optional
-from urllib import error as _error, request as _request
+import socket as _socket
+import threading as _threading
+import time as _time
+import zlib as _zlib
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib import parse as _parse
+
+if TYPE_CHECKING:
+    from .retry import RetryPolicy
 
 
 class RequestException(Exception):
@@ -15,25 +24,139 @@ class HTTPError(RequestException):
         self.response = response
 
 
+ACCEPT_ENCODING = "gzip, deflate"
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def _header(headers: Dict[str, Any], name: str) -> Optional[str]:
+    lowered = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+
+class _ContentDecoder:
+    """Incrementally undoes a gzip or deflate Content-Encoding."""
+
+    def __init__(self, encoding: Optional[str]) -> None:
+        self.encoding = (encoding or "identity").strip().lower()
+        if self.encoding in ("gzip", "x-gzip"):
+            self._obj = _zlib.decompressobj(16 + _zlib.MAX_WBITS)
+        elif self.encoding == "deflate":
+            self._obj = _zlib.decompressobj()
+        else:
+            self._obj = None
+        self._first = True
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._obj is None or not data:
+            return data
+        if self._first and self.encoding == "deflate":
+            self._first = False
+            try:
+                return self._obj.decompress(data)
+            except _zlib.error:
+                # Some servers send raw deflate streams without the zlib header.
+                self._obj = _zlib.decompressobj(-_zlib.MAX_WBITS)
+        self._first = False
+        return self._obj.decompress(data)
+
+    def flush(self) -> bytes:
+        if self._obj is None:
+            return b""
+        return self._obj.flush()
+
+
 class Response:
-    def __init__(self, status_code: int, headers: Dict[str, Any], content: bytes) -> None:
+    def __init__(self, status_code: int, headers: Dict[str, Any], content: bytes = b"", *,
+                 raw: Optional[Any] = None,
+                 release: Optional[Callable[[bool], None]] = None) -> None:
         self.status_code = status_code
         self.headers = headers
-        self._content = content
+        self._content: Optional[bytes] = content if raw is None else None
+        self._raw = raw
+        self._release = release
+        self._consumed = raw is None
 
     @property
     def text(self) -> str:
+        content = self.content
         try:
-            return self._content.decode("utf-8")
+            return content.decode("utf-8")
         except UnicodeDecodeError:
-            return self._content.decode("utf-8", errors="replace")
+            return content.decode("utf-8", errors="replace")
 
     @property
     def content(self) -> bytes:
+        if self._content is None:
+            if self._consumed:
+                raise RuntimeError("The content for this response was already consumed")
+            self._content = b"".join(self.iter_content(_CHUNK_SIZE))
         return self._content
 
+    def iter_content(self, chunk_size: int = _CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield the decoded body in chunks without buffering all of it."""
+        if self._content is not None:
+            for start in range(0, len(self._content), chunk_size):
+                yield self._content[start:start + chunk_size]
+            return
+        if self._consumed:
+            raise RuntimeError("The content for this response was already consumed")
+        self._consumed = True
+        decoder = _ContentDecoder(_header(self.headers, "Content-Encoding"))
+        try:
+            while True:
+                try:
+                    chunk = self._raw.read1(chunk_size)
+                    data = decoder.decompress(chunk) if chunk else decoder.flush()
+                except (OSError, _http.HTTPException) as exc:
+                    raise RequestException(str(exc), reason=exc)
+                except _zlib.error as exc:
+                    raise RequestException(f"Invalid compressed body: {exc}", reason=exc)
+                if data:
+                    yield data
+                if not chunk:
+                    break
+        except BaseException:
+            self._finish(reusable=False)
+            raise
+        # Marks the exchange complete so http.client accepts the next request.
+        self._raw.close()
+        self._finish(reusable=True)
+
+    def iter_lines(self, chunk_size: int = _CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield the body line by line, e.g. for server-sent events."""
+        pending = b""
+        for chunk in self.iter_content(chunk_size):
+            lines = (pending + chunk).splitlines(keepends=True)
+            pending = lines.pop() if lines and not lines[-1].endswith((b"\n", b"\r")) else b""
+            for line in lines:
+                yield line.rstrip(b"\r\n")
+        if pending:
+            yield pending
+
+    def close(self) -> None:
+        """Release a streamed response, dropping its connection if unread."""
+        if not self._consumed:
+            self._consumed = True
+            self._finish(reusable=False)
+
+    def __enter__(self) -> "Response":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _finish(self, reusable: bool) -> None:
+        release, self._release = self._release, None
+        if release is not None:
+            release(reusable)
+
     def json(self) -> Any:
-        if not self._content:
+        content = self.content
+        if not content:
             return {}
         return _json.loads(self.text)
 
@@ -42,49 +165,257 @@ class Response:
             raise HTTPError(f"HTTP {self.status_code}", self)
 
 
-def request(method: str, url: str, *, headers: Optional[Dict[str, str]] = None,
+_ConnKey = Tuple[str, str, int]
+_Params = Optional[Dict[str, Any]]
+
+
+def _prepare_url(url: str, params: _Params) -> str:
+    if not params:
+        return url
+    items = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for item in values:
+            if isinstance(item, bool):
+                item = "true" if item else "false"
+            items.append((str(key), str(item)))
+    return _build_url(url, tuple(items))
+
+
+@_functools.lru_cache(maxsize=1024)
+def _build_url(url: str, items: Tuple[Tuple[str, str], ...]) -> str:
+    if not items:
+        return url
+    parts = _parse.urlsplit(url)
+    query = _parse.urlencode(items)
+    if parts.query:
+        query = f"{parts.query}&{query}"
+    return _parse.urlunsplit((parts.scheme, parts.netloc, parts.path, query, parts.fragment))
+
+# Errors raised when a pooled keep-alive connection turns out to have been
+# closed by the server between two requests.
+_STALE_CONNECTION_ERRORS = (
+    _http.RemoteDisconnected,
+    _http.BadStatusLine,
+    _http.CannotSendRequest,
+    _http.ResponseNotReady,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class Session:
+    """Keeps persistent per-host HTTP connections across requests.
+
+    Idle connections are pooled per (scheme, host, port) and reused while the
+    server keeps them open; a connection that was closed server-side is
+    replaced transparently. A session may be shared between threads.
+    When a ``retry`` policy is given, every request goes through it.
+    ``on_request`` is called after every attempt with the method, URL, status
+    (``None`` if no response was received) and elapsed seconds.
+    """
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None,
+                 max_idle_per_host: int = 10, max_redirects: int = 5,
+                 retry: Optional["RetryPolicy"] = None,
+                 on_request: Optional[Callable[[str, str, Optional[int], float], None]] = None
+                 ) -> None:
+        self.headers = dict(headers or {})
+        self.retry = retry
+        self.on_request = on_request
+        self.max_idle_per_host = max_idle_per_host
+        self.max_redirects = max_redirects
+        self._idle: Dict[_ConnKey, List[_http.HTTPConnection]] = {}
+        self._lock = _threading.Lock()
+        self._closed = False
+
+    def __enter__(self) -> "Session":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+            self._closed = True
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def request(self, method: str, url: str, *, params: _Params = None,
+                headers: Optional[Dict[str, str]] = None,
+                data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
+                timeout: int = 60, stream: bool = False) -> Response:
+        method = method.upper()
+        url = _prepare_url(url, params)
+        payload = data
+        req_headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        req_headers.update(self.headers)
+        req_headers.update(headers or {})
+
+        if json is not None:
+            payload = _json.dumps(json).encode("utf-8")
+            req_headers.setdefault("Content-Type", "application/json")
+        elif isinstance(payload, str):
+            payload = payload.encode("utf-8")
+
+        def send() -> Response:
+            if self.on_request is None:
+                return self._request_once(method, url, req_headers, payload, timeout, stream)
+            start = _time.perf_counter()
+            status = None
+            try:
+                response = self._request_once(method, url, req_headers, payload, timeout, stream)
+                status = response.status_code
+                return response
+            except HTTPError as exc:
+                status = exc.response.status_code
+                raise
+            finally:
+                self.on_request(method, url, status, _time.perf_counter() - start)
+
+        if self.retry is None:
+            return send()
+        return self.retry.run(_parse.urlsplit(url).hostname or "", send)
+
+    def _request_once(self, method: str, url: str, req_headers: Dict[str, str],
+                      payload: Optional[bytes], timeout: int, stream: bool) -> Response:
+        for _ in range(self.max_redirects + 1):
+            response = self._send(method, url, req_headers, payload, timeout, stream)
+            location = _header(response.headers, "Location")
+            if response.status_code not in _REDIRECT_CODES or not location:
+                break
+            response.content  # drain the body so the connection can be reused
+            url = _parse.urljoin(url, location)
+            if response.status_code == 303 or (
+                response.status_code in (301, 302) and method == "POST"
+            ):
+                method, payload = "GET", None
+
+        if 400 <= response.status_code:
+            response.content  # error bodies are always buffered for the caller
+            raise HTTPError(f"HTTP Error {response.status_code}", response)
+        return response
+
+    def get(self, url: str, *, params: _Params = None,
+            headers: Optional[Dict[str, str]] = None, timeout: int = 60,
+            stream: bool = False) -> Response:
+        return self.request("GET", url, params=params, headers=headers, timeout=timeout,
+                            stream=stream)
+
+    def post(self, url: str, *, headers: Optional[Dict[str, str]] = None,
+             data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
+             timeout: int = 60, stream: bool = False) -> Response:
+        return self.request("POST", url, headers=headers, data=data, json=json, timeout=timeout,
+                            stream=stream)
+
+    def patch(self, url: str, *, headers: Optional[Dict[str, str]] = None,
+              data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
+              timeout: int = 60, stream: bool = False) -> Response:
+        return self.request("PATCH", url, headers=headers, data=data, json=json, timeout=timeout,
+                            stream=stream)
+
+    def _send(self, method: str, url: str, headers: Dict[str, str],
+              payload: Optional[bytes], timeout: int, stream: bool) -> Response:
+        parts = _parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https") or not parts.hostname:
+            raise RequestException(f"Unsupported URL: {url}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+
+        while True:
+            conn, reused = self._acquire(key, timeout)
+            try:
+                conn.request(method, target, body=payload, headers=headers)
+                resp = conn.getresponse()
+            except _STALE_CONNECTION_ERRORS as exc:
+                conn.close()
+                if reused:
+                    continue
+                raise RequestException(str(exc), reason=exc)
+            except (OSError, _http.HTTPException) as exc:
+                conn.close()
+                if isinstance(exc, _socket.timeout):
+                    raise RequestException("timed out", reason=exc)
+                raise RequestException(str(exc), reason=exc)
+            break
+
+        def release(reusable: bool) -> None:
+            if reusable and not resp.will_close:
+                self._release(key, conn)
+            else:
+                conn.close()
+
+        response = Response(resp.status, dict(resp.getheaders()), raw=resp, release=release)
+        if not stream:
+            response.content  # buffer now; also returns the connection to the pool
+        return response
+
+    def _acquire(self, key: _ConnKey, timeout: int) -> Tuple[_http.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port = key
+        if scheme == "https":
+            return _http.HTTPSConnection(host, port, timeout=timeout), False
+        return _http.HTTPConnection(host, port, timeout=timeout), False
+
+    def _release(self, key: _ConnKey, conn: _http.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if not self._closed and len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+def request(method: str, url: str, *, params: _Params = None,
+            headers: Optional[Dict[str, str]] = None,
             data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
-            timeout: int = 60) -> Response:
-    payload = data
-    req_headers = dict(headers or {})
-
-    if json is not None:
-        payload = _json.dumps(json).encode("utf-8")
-        req_headers.setdefault("Content-Type", "application/json")
-    elif isinstance(payload, str):
-        payload = payload.encode("utf-8")
-
-    req = _request.Request(url, data=payload, headers=req_headers, method=method.upper())
-    try:
-        with _request.urlopen(req, timeout=timeout) as resp:
-            content = resp.read()
-            status = getattr(resp, 'status', resp.getcode())
-            return Response(status, dict(resp.headers), content)
-    except _error.HTTPError as exc:
-        content = exc.read()
-        response = Response(exc.code, dict(exc.headers or {}), content)
-        raise HTTPError(str(exc), response)
-    except _error.URLError as exc:
-        raise RequestException(str(exc), reason=exc.reason)
+            timeout: int = 60, stream: bool = False) -> Response:
+    with Session() as session:
+        return session.request(method, url, params=params, headers=headers, data=data,
+                               json=json, timeout=timeout, stream=stream)
 
 
 def post(url: str, *, headers: Optional[Dict[str, str]] = None,
          data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
-         timeout: int = 60) -> Response:
-    return request("POST", url, headers=headers, data=data, json=json, timeout=timeout)
+         timeout: int = 60, stream: bool = False) -> Response:
+    return request("POST", url, headers=headers, data=data, json=json, timeout=timeout,
+                   stream=stream)
 
 
 def patch(url: str, *, headers: Optional[Dict[str, str]] = None,
           data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
-          timeout: int = 60) -> Response:
-    return request("PATCH", url, headers=headers, data=data, json=json, timeout=timeout)
+          timeout: int = 60, stream: bool = False) -> Response:
+    return request("PATCH", url, headers=headers, data=data, json=json, timeout=timeout,
+                   stream=stream)
+
+
+def get(url: str, *, params: _Params = None, headers: Optional[Dict[str, str]] = None,
+        timeout: int = 60, stream: bool = False) -> Response:
+    return request("GET", url, params=params, headers=headers, timeout=timeout, stream=stream)
 
 
-def get(url: str, *, headers: Optional[Dict[str, str]] = None,
-        timeout: int = 60) -> Response:
-    return request("GET", url, headers=headers, timeout=timeout)
+from .retry import DeadlineExceeded, RateLimiter, RetryPolicy, TokenBucket  # noqa: E402
 
 
 class exceptions:
     RequestException = RequestException
     HTTPError = HTTPError
+    DeadlineExceeded = DeadlineExceeded
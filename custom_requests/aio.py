@@ -0,0 +1,271 @@
+import asyncio
+import json as _json
+import ssl as _ssl
+import zlib as _zlib
+from typing import Any, Dict, List, Optional, Tuple
+from urllib import parse as _parse
+
+from . import (ACCEPT_ENCODING, HTTPError, RequestException, Response, _ContentDecoder,
+               _header, _Params, _prepare_url)
+
+_ConnKey = Tuple[str, str, int]
+
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.reader = reader
+        self.writer = writer
+
+    def close(self) -> None:
+        self.writer.close()
+
+    @property
+    def is_closing(self) -> bool:
+        return self.writer.is_closing() or self.reader.at_eof()
+
+
+class AsyncSession:
+    """asyncio counterpart of ``Session`` built on asyncio streams.
+
+    Connections are pooled per (scheme, host, port) and at most
+    ``limit_per_host`` requests are in flight against one host; further
+    requests wait for a free slot. Many coroutines can share one session.
+    """
+
+    def __init__(self, headers: Optional[Dict[str, str]] = None,
+                 limit_per_host: int = 100, max_redirects: int = 5) -> None:
+        self.headers = dict(headers or {})
+        self.limit_per_host = limit_per_host
+        self.max_redirects = max_redirects
+        self._idle: Dict[_ConnKey, List[_Connection]] = {}
+        self._slots: Dict[_ConnKey, asyncio.Semaphore] = {}
+        self._ssl_context: Optional[_ssl.SSLContext] = None
+
+    async def __aenter__(self) -> "AsyncSession":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+                try:
+                    await conn.writer.wait_closed()
+                except (OSError, _ssl.SSLError):
+                    pass
+
+    async def request(self, method: str, url: str, *, params: _Params = None,
+                      headers: Optional[Dict[str, str]] = None,
+                      data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
+                      timeout: int = 60) -> Response:
+        method = method.upper()
+        url = _prepare_url(url, params)
+        payload = data
+        req_headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        req_headers.update(self.headers)
+        req_headers.update(headers or {})
+
+        if json is not None:
+            payload = _json.dumps(json).encode("utf-8")
+            req_headers.setdefault("Content-Type", "application/json")
+        elif isinstance(payload, str):
+            payload = payload.encode("utf-8")
+
+        for _ in range(self.max_redirects + 1):
+            try:
+                response = await asyncio.wait_for(
+                    self._send(method, url, req_headers, payload), timeout
+                )
+            except asyncio.TimeoutError as exc:
+                raise RequestException("timed out", reason=exc)
+            location = _header(response.headers, "Location")
+            if response.status_code not in _REDIRECT_CODES or not location:
+                break
+            url = _parse.urljoin(url, location)
+            if response.status_code == 303 or (
+                response.status_code in (301, 302) and method == "POST"
+            ):
+                method, payload = "GET", None
+
+        if 400 <= response.status_code:
+            raise HTTPError(f"HTTP Error {response.status_code}", response)
+        return response
+
+    async def get(self, url: str, *, params: _Params = None,
+                  headers: Optional[Dict[str, str]] = None, timeout: int = 60) -> Response:
+        return await self.request("GET", url, params=params, headers=headers, timeout=timeout)
+
+    async def post(self, url: str, *, headers: Optional[Dict[str, str]] = None,
+                   data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
+                   timeout: int = 60) -> Response:
+        return await self.request("POST", url, headers=headers, data=data, json=json,
+                                  timeout=timeout)
+
+    async def patch(self, url: str, *, headers: Optional[Dict[str, str]] = None,
+                    data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
+                    timeout: int = 60) -> Response:
+        return await self.request("PATCH", url, headers=headers, data=data, json=json,
+                                  timeout=timeout)
+
+    async def _send(self, method: str, url: str, headers: Dict[str, str],
+                    payload: Optional[bytes]) -> Response:
+        parts = _parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https") or not parts.hostname:
+            raise RequestException(f"Unsupported URL: {url}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname, port)
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+        host = parts.hostname if port in (80, 443) else f"{parts.hostname}:{port}"
+        head = self._build_head(method, target, host, headers, payload)
+
+        slots = self._slots.get(key)
+        if slots is None:
+            slots = self._slots[key] = asyncio.Semaphore(self.limit_per_host)
+        async with slots:
+            while True:
+                conn, reused = await self._acquire(key)
+                try:
+                    conn.writer.write(head)
+                    if payload:
+                        conn.writer.write(payload)
+                    await conn.writer.drain()
+                    status, resp_headers, content, keep_alive = await self._read_response(
+                        conn.reader, method
+                    )
+                except (asyncio.IncompleteReadError, ConnectionError) as exc:
+                    conn.close()
+                    if reused:
+                        continue
+                    raise RequestException(str(exc) or "connection closed", reason=exc)
+                except (OSError, _ssl.SSLError, ValueError) as exc:
+                    conn.close()
+                    raise RequestException(str(exc), reason=exc)
+                except BaseException:
+                    conn.close()
+                    raise
+                break
+
+            if keep_alive:
+                self._idle.setdefault(key, []).append(conn)
+            else:
+                conn.close()
+
+        decoder = _ContentDecoder(_header(resp_headers, "Content-Encoding"))
+        try:
+            content = decoder.decompress(content) + decoder.flush()
+        except _zlib.error as exc:
+            raise RequestException(f"Invalid compressed body: {exc}", reason=exc)
+        return Response(status, resp_headers, content)
+
+    def _build_head(self, method: str, target: str, host: str, headers: Dict[str, str],
+                    payload: Optional[bytes]) -> bytes:
+        lowered = {name.lower() for name in headers}
+        lines = [f"{method} {target} HTTP/1.1"]
+        if "host" not in lowered:
+            lines.append(f"Host: {host}")
+        if "accept" not in lowered:
+            lines.append("Accept: */*")
+        lines.append("Connection: keep-alive")
+        if payload is not None or method in ("POST", "PUT", "PATCH"):
+            lines.append(f"Content-Length: {len(payload or b'')}")
+        for name, value in headers.items():
+            if name.lower() in ("content-length", "connection"):
+                continue
+            lines.append(f"{name}: {value}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+    async def _read_response(self, reader: asyncio.StreamReader,
+                             method: str) -> Tuple[int, Dict[str, Any], bytes, bool]:
+        status_line = await reader.readuntil(b"\r\n")
+        version, _, rest = status_line.decode("latin-1").strip().partition(" ")
+        if not version.startswith("HTTP/"):
+            raise ValueError(f"Bad status line: {status_line!r}")
+        status = int(rest.split(" ", 1)[0])
+
+        headers: Dict[str, Any] = {}
+        lowered: Dict[str, str] = {}
+        while True:
+            line = (await reader.readuntil(b"\r\n")).decode("latin-1")
+            if line == "\r\n":
+                break
+            name, _, value = line.partition(":")
+            name, value = name.strip(), value.strip()
+            headers[name] = value
+            lowered[name.lower()] = value
+
+        keep_alive = lowered.get("connection", "").lower() != "close" and version != "HTTP/1.0"
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            content = b""
+        elif "chunked" in lowered.get("transfer-encoding", "").lower():
+            content = await self._read_chunked(reader)
+        elif "content-length" in lowered:
+            content = await reader.readexactly(int(lowered["content-length"]))
+        else:
+            content = await reader.read()
+            keep_alive = False
+        return status, headers, content, keep_alive
+
+    async def _read_chunked(self, reader: asyncio.StreamReader) -> bytes:
+        chunks = []
+        while True:
+            size_line = await reader.readuntil(b"\r\n")
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    async def _acquire(self, key: _ConnKey) -> Tuple[_Connection, bool]:
+        idle = self._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if not conn.is_closing:
+                return conn, True
+            conn.close()
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = _ssl.create_default_context()
+            ssl_context = self._ssl_context
+        try:
+            reader, writer = await asyncio.open_connection(host, port, ssl=ssl_context)
+        except (OSError, _ssl.SSLError) as exc:
+            raise RequestException(str(exc), reason=exc)
+        return _Connection(reader, writer), False
+
+
+async def request(method: str, url: str, *, params: _Params = None,
+                  headers: Optional[Dict[str, str]] = None,
+                  data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
+                  timeout: int = 60) -> Response:
+    async with AsyncSession() as session:
+        return await session.request(method, url, params=params, headers=headers, data=data,
+                                     json=json, timeout=timeout)
+
+
+async def post(url: str, *, headers: Optional[Dict[str, str]] = None,
+               data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
+               timeout: int = 60) -> Response:
+    return await request("POST", url, headers=headers, data=data, json=json, timeout=timeout)
+
+
+async def patch(url: str, *, headers: Optional[Dict[str, str]] = None,
+                data: Optional[Any] = None, json: Optional[Dict[str, Any]] = None,
+                timeout: int = 60) -> Response:
+    return await request("PATCH", url, headers=headers, data=data, json=json, timeout=timeout)
+
+
+async def get(url: str, *, params: _Params = None, headers: Optional[Dict[str, str]] = None,
+              timeout: int = 60) -> Response:
+    return await request("GET", url, params=params, headers=headers, timeout=timeout)
@@ -0,0 +1,176 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Iterable, Optional, TypeVar
+
+from . import HTTPError, RequestException, Response, _header
+
+T = TypeVar("T")
+
+RETRY_STATUSES = (408, 409, 425, 429, 500, 502, 503, 504)
+
+
+class DeadlineExceeded(RequestException):
+    """Raised when a call cannot finish (or even start) before its deadline."""
+
+
+class TokenBucket:
+    """Client-side token bucket refilled at ``rate`` tokens per second."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: Optional[float] = None) -> None:
+        """Take one token, sleeping until one is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded("deadline exceeded while waiting for rate limit")
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for ``seconds``, e.g. after a 429 with Retry-After."""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = now
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+
+class RateLimiter:
+    """Keeps one ``TokenBucket`` per host; hosts without a rate are unlimited."""
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None,
+                 default_rate: Optional[float] = None) -> None:
+        self.default_rate = default_rate
+        self._rates = dict(rates or {})
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def set_rate(self, host: str, rate: float) -> None:
+        with self._lock:
+            self._rates[host] = rate
+            self._buckets.pop(host, None)
+
+    def bucket(self, host: str) -> Optional[TokenBucket]:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate = self._rates.get(host, self.default_rate)
+                if rate is None:
+                    return None
+                bucket = self._buckets[host] = TokenBucket(rate)
+            return bucket
+
+
+class RetryPolicy:
+    """Retries transient failures with exponential backoff and full jitter.
+
+    Connection errors and responses whose status is in ``retry_statuses`` are
+    retried up to ``max_attempts`` times (``None`` means no attempt limit).
+    A ``Retry-After`` header overrides the computed backoff and pauses the
+    host's token bucket so concurrent callers back off together. No retry is
+    scheduled past ``call_timeout`` seconds from the start of a call, nor past
+    ``run_timeout`` seconds from the creation of the policy.
+    """
+
+    def __init__(self, max_attempts: Optional[int] = 5, backoff_base: float = 0.5,
+                 backoff_max: float = 30.0, retry_statuses: Iterable[int] = RETRY_STATUSES,
+                 call_timeout: Optional[float] = None, run_timeout: Optional[float] = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 on_retry: Optional[Callable[[int, float, RequestException], None]] = None
+                 ) -> None:
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_statuses = frozenset(retry_statuses)
+        self.call_timeout = call_timeout
+        self.run_deadline = time.monotonic() + run_timeout if run_timeout is not None else None
+        self.rate_limiter = rate_limiter
+        self.on_retry = on_retry
+
+    def run(self, host: str, send: Callable[[], T]) -> T:
+        """Call ``send`` until it succeeds, retrying according to this policy."""
+        deadline = self._call_deadline()
+        bucket = self.rate_limiter.bucket(host) if self.rate_limiter else None
+        attempt = 0
+        while True:
+            attempt += 1
+            if bucket is not None:
+                bucket.acquire(deadline)
+            try:
+                return send()
+            except RequestException as exc:
+                if not self.is_retryable(exc):
+                    raise
+                if self.max_attempts is not None and attempt >= self.max_attempts:
+                    raise
+                retry_after = self.retry_after(exc)
+                if retry_after is not None and bucket is not None:
+                    bucket.pause(retry_after)
+                delay = retry_after if retry_after is not None else self.backoff(attempt)
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise
+                if self.on_retry is not None:
+                    self.on_retry(attempt, delay, exc)
+                time.sleep(delay)
+
+    def is_retryable(self, exc: RequestException) -> bool:
+        if isinstance(exc, DeadlineExceeded):
+            return False
+        if isinstance(exc, HTTPError):
+            return exc.response.status_code in self.retry_statuses
+        return True
+
+    def backoff(self, attempt: int) -> float:
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+    def retry_after(self, exc: RequestException) -> Optional[float]:
+        if not isinstance(exc, HTTPError):
+            return None
+        return parse_retry_after(exc.response)
+
+    def _call_deadline(self) -> Optional[float]:
+        deadline = self.run_deadline
+        if self.call_timeout is not None:
+            call_deadline = time.monotonic() + self.call_timeout
+            deadline = call_deadline if deadline is None else min(deadline, call_deadline)
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded("run deadline exceeded")
+        return deadline
+
+
+def parse_retry_after(response: Response) -> Optional[float]:
+    value = _header(response.headers, "Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, OverflowError):
+        return None
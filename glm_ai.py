@@ -1,58 +1,180 @@
 import json
 import os
 import re
-from typing import List, Optional
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 
-import requests
+import custom_requests as requests
+from custom_requests import RateLimiter, RetryPolicy
 from dotenv import load_dotenv
 
+from llm_cache import LlmCache
+from metrics import Metrics
+from structured_output import complete_value, parse_structured
+
+_CJK_RE = re.compile(r"[\u3000-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# A short label such as "分类：" or "Category:" in front of a one-line answer.
+_LABEL_RE = re.compile(r"^\s*[^\s:：]{1,12}[:：]")
+
+
+def answer_line(text: str, finished: bool = True) -> str:
+    """The answer in a one-line reply: its first line with more than a label like ``分类：``.
+
+    With ``finished`` false the last line is taken as still being written and
+    is ignored.
+    """
+    lines = text.split("\n")
+    if not finished:
+        lines = lines[:-1]
+    for line in lines:
+        line = _LABEL_RE.sub("", line).strip()
+        if line:
+            return line
+    return ""
+
+
+def answer_complete(text: str, stop: str) -> bool:
+    """Whether a partial completion already holds the whole answer.
+
+    ``stop`` is ``"json"`` for a complete JSON object or ``"array"`` for a
+    complete JSON array, anywhere in the text, or ``"line"`` for a finished
+    line holding the answer (see ``answer_line``).
+    """
+    if stop == "line":
+        return bool(answer_line(text, finished=False))
+    return complete_value(text, list if stop == "array" else dict)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per four other characters."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
 
 class GlmAi:
-    """Helper around GLM official chat completion API for tagging and classification."""
+    """Helper around GLM official chat completion API for tagging and classification.
+
+    The endpoint speaks the OpenAI chat completion protocol, so given another
+    ``base_url``, ``model`` and key the same client talks to DeepSeek or to
+    Ollama's ``/v1`` API; see ``llm_backend``.
+    """
+
+    # Bump whenever a prompt changes so cached answers to the old prompt are not reused.
+    PROMPT_VERSION = "1"
 
     def __init__(
         self,
         api_key: Optional[str] = None,
         model: str = "glm-4.5-air",
-        base_url: str = "https://open.bigmodel.cn/api/paas/v4/chat/completions",
+        base_url: Optional[str] = None,
         timeout: int = 60,
         env_file: Optional[str] = ".env",
+        requests_per_second: Optional[float] = None,
+        run_timeout: Optional[float] = None,
+        cache: Optional[LlmCache] = None,
+        metrics: Optional[Metrics] = None,
+        stream: bool = False,
+        backend: Optional[Callable[[List[dict], Optional[str]], Tuple[str, str]]] = None,
     ) -> None:
         if env_file:
             load_dotenv(env_file)
         else:
             load_dotenv()
         self.api_key = api_key or os.environ.get("GLM_API_KEY")
-        if not self.api_key:
+        if not self.api_key and backend is None:
             raise ValueError("GLM_API_KEY is required either via parameter or environment variable")
         self.model = model
-        self.base_url = base_url
+        # GLM_BASE_URL lets a local stand-in server replace the real endpoint.
+        self.base_url = (
+            base_url
+            or os.environ.get("GLM_BASE_URL")
+            or "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+        )
         self.timeout = timeout
+        self.cache = cache
+        self.metrics = metrics or Metrics()
+        # Stream completions and hang up as soon as the expected answer is complete.
+        self.stream = stream
+        # Answers the prompts instead of ``chat``, e.g. a FailoverBackend over
+        # several providers; ``backend(messages, stop)`` returns the answer and
+        # the model that wrote it, and may list its ``models`` for cache lookups.
+        self.backend = backend
+        rate_limiter = None
+        if requests_per_second:
+            rate_limiter = RateLimiter({urlsplit(self.base_url).hostname: requests_per_second})
+        self.session = requests.Session(retry=RetryPolicy(
+            max_attempts=6,
+            backoff_base=1.0,
+            backoff_max=60.0,
+            call_timeout=timeout * 5,
+            run_timeout=run_timeout,
+            rate_limiter=rate_limiter,
+            on_retry=self._log_retry,
+        ), on_request=self.metrics.observe_http)
 
     def generate_summary_and_tags(self, text: str) -> dict:
         """Return summary string and tags list derived from input text."""
+        cached = self._cache_get("summary_and_tags", text)
+        if isinstance(cached, dict):
+            return cached
+
         prompt = (
             "请根据以下内容生成一个简短摘要，并给出若干标签。"
             "\n要求返回严格 JSON 格式，例如 {\"summary\": \"...\", \"tags\": [\"...\"]}."
             "\n只返回 JSON。"
         )
-        content = self._chat([
+        content, model = self._complete([
             {"role": "system", "content": "你是一名擅长内容分析的助手。"},
             {"role": "user", "content": f"内容如下：\n{text}\n{prompt}"},
-        ])
+        ], stop="json")
 
-        content = content.strip()
-        if content.startswith("```"):
-            content = re.sub(r"^```(?:json)?|```$", "", content).strip()
+        result = self.parse_analysis(content)
+        self._cache_set(model, result, "summary_and_tags", text)
+        return result
 
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError as exc:
-            sanitized = content.replace("'", '"')
-            try:
-                return json.loads(sanitized)
-            except json.JSONDecodeError as exc2:
-                raise ValueError(f"GLM 输出无法解析为 JSON: {content}") from exc2
+    def analyze(self, text: str, categories: Optional[List[str]] = None) -> dict:
+        """Return summary, tags and category for the text from a single completion."""
+        cached = self._cache_get("analyze", text, categories or [])
+        if isinstance(cached, dict):
+            return cached
+
+        content, model = self._complete(self.analyze_messages(text, categories), stop="json")
+        result = self.parse_analysis(content)
+        self._cache_set(model, result, "analyze", text, categories or [])
+        return result
+
+    def analyze_messages(self, text: str, categories: Optional[List[str]] = None) -> List[dict]:
+        """Chat messages used by ``analyze``; also written to offline batch files."""
+        category_prompt = (
+            f"\n分类必须从以下列表中选择一个：{','.join(categories)}。"
+            if categories
+            else ""
+        )
+        prompt = (
+            "请根据以下内容生成一个简短摘要，给出若干标签，并给出最合适的分类名称。"
+            f"{category_prompt}"
+            "\n要求返回严格 JSON 格式，例如 "
+            "{\"summary\": \"...\", \"tags\": [\"...\"], \"category\": \"...\"}."
+            "\n只返回 JSON。"
+        )
+        return [
+            {"role": "system", "content": "你是一名擅长内容分析和分类的助手。"},
+            {"role": "user", "content": f"内容如下：\n{text}\n{prompt}"},
+        ]
+
+    def parse_analysis(self, content: str) -> dict:
+        result = self._parse_json(content)
+        if not isinstance(result, dict):
+            raise ValueError(f"GLM 输出不是 JSON 对象: {content}")
+        return result
+
+    def chat_payload(self, messages: List[dict]) -> dict:
+        """Request body of a chat completion with this client's model."""
+        return {
+            "model": self.model,
+            "messages": messages,
+        }
 
     def classify(
         self,
@@ -61,6 +183,11 @@ class GlmAi:
         categories: Optional[List[str]] = None,
     ) -> str:
         """Return a single category name given summary/tags and optional category list."""
+        inputs = self._classify_inputs({"summary": summary, "tags": tags}, categories)
+        cached = self._cache_get(*inputs)
+        if cached is not None:
+            return cached
+
         tags_part = f"，标签：{','.join(tags)}" if tags else ""
         category_prompt = (
             f"可选分类列表：{','.join(categories)}。"
@@ -71,30 +198,165 @@ class GlmAi:
             f"请结合以上信息{category_prompt}给出最合适的分类名称，"
             "直接输出分类名称，不要附带额外文字。"
         )
-        content = self._chat([
+        content, model = self._complete([
             {"role": "system", "content": "你是一名分类助手，只返回一个分类名称。"},
             {"role": "user", "content": f"摘要：{summary}{tags_part}。{prompt}"},
-        ])
-        return content.strip()
+        ], stop="line")
+        result = answer_line(content)
+        if result:
+            self._cache_set(model, result, *inputs)
+        return result
 
-    def _chat(self, messages: List[dict]) -> str:
+    def pack_classify_batches(
+        self,
+        items: List[dict],
+        categories: Optional[List[str]] = None,
+        token_budget: int = 4000,
+    ) -> List[List[dict]]:
+        """Split ``{id, summary, tags}`` items into groups whose prompt fits the token budget."""
+        overhead = estimate_tokens(self._classify_batch_prompt(categories)) + 50
+        batches: List[List[dict]] = []
+        current: List[dict] = []
+        used = overhead
+        for item in items:
+            cost = estimate_tokens(self._classify_batch_line(0, item)) + 15
+            if current and used + cost > token_budget:
+                batches.append(current)
+                current, used = [], overhead
+            current.append(item)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def classify_batch(
+        self,
+        items: List[dict],
+        categories: Optional[List[str]] = None,
+    ) -> Dict[str, str]:
+        """Classify several ``{id, summary, tags}`` items in one completion.
+
+        Returns a mapping from item id to the category the model chose. Items
+        that are missing from the answer are absent from the mapping; answers
+        outside ``categories`` are returned as-is for the caller to reject.
+        """
+        results: Dict[str, str] = {}
+        pending = []
+        for item in items:
+            cached = self._cache_get(*self._classify_inputs(item, categories))
+            if cached is not None:
+                results[item["id"]] = cached
+            else:
+                pending.append(item)
+        if not pending:
+            return results
+
+        lines = "\n".join(
+            self._classify_batch_line(index, item) for index, item in enumerate(pending, 1)
+        )
+        content, model = self._complete([
+            {"role": "system", "content": "你是一名分类助手，只返回 JSON 数组。"},
+            {"role": "user", "content": f"{lines}\n{self._classify_batch_prompt(categories)}"},
+        ], stop="array")
+
+        answer = self._parse_json(content, prefer=list)
+        if isinstance(answer, dict):
+            answer = answer.get("results") or answer.get("items") or []
+        if not isinstance(answer, list):
+            raise ValueError(f"GLM 输出不是 JSON 数组: {content}")
+        for entry in answer:
+            if not isinstance(entry, dict):
+                continue
+            try:
+                item = pending[int(entry.get("id")) - 1]
+            except (TypeError, ValueError, IndexError):
+                continue
+            category = entry.get("category")
+            if not isinstance(category, str) or not category.strip():
+                continue
+            category = category.strip()
+            results[item["id"]] = category
+            if not categories or category in categories:
+                self._cache_set(model, category, *self._classify_inputs(item, categories))
+        return results
+
+    @staticmethod
+    def _classify_batch_line(index: int, item: dict) -> str:
+        tags = item.get("tags") or []
+        tags_part = f"，标签：{','.join(tags)}" if tags else ""
+        return f"[{index}] 摘要：{item.get('summary', '')}{tags_part}"
+
+    @staticmethod
+    def _classify_batch_prompt(categories: Optional[List[str]]) -> str:
+        category_prompt = (
+            f"可选分类列表：{','.join(categories)}。"
+            if categories
+            else ""
+        )
+        return (
+            f"以上每行是一条以 [编号] 开头的记录。请结合摘要和标签，{category_prompt}"
+            "为每条记录给出最合适的分类名称。"
+            "\n要求返回严格 JSON 数组，例如 [{\"id\": 1, \"category\": \"...\"}]，"
+            "每条记录一项。\n只返回 JSON。"
+        )
+
+    @staticmethod
+    def _classify_inputs(item: dict, categories: Optional[List[str]]) -> tuple:
+        return "classify", item.get("summary", ""), item.get("tags") or [], categories or []
+
+    @staticmethod
+    def _parse_json(content: str, prefer: type = dict):
+        try:
+            return parse_structured(content, prefer)
+        except ValueError as exc:
+            raise ValueError(f"GLM 输出无法解析为 JSON: {content}") from exc
+
+    def _cache_key(self, model: str, kind: str, *inputs) -> str:
+        return LlmCache.make_key(model, self.PROMPT_VERSION, kind, *inputs)
+
+    def _cache_get(self, kind: str, *inputs):
+        """Cached answer of the first model that may answer and has one."""
+        if self.cache is None:
+            return None
+        for model in getattr(self.backend, "models", None) or [self.model]:
+            value = self.cache.get(self._cache_key(model, kind, *inputs))
+            if value is not None:
+                return value
+        return None
+
+    def _cache_set(self, model: str, value, kind: str, *inputs) -> None:
+        if self.cache is not None:
+            self.cache.set(self._cache_key(model, kind, *inputs), value)
+
+    def _complete(self, messages: List[dict], stop: Optional[str] = None) -> Tuple[str, str]:
+        """Completion text and the model that wrote it."""
+        if self.backend is not None:
+            return self.backend(messages, stop)
+        return self.chat(messages, stop), self.model
+
+    def chat(self, messages: List[dict], stop: Optional[str] = None) -> str:
+        """Completion text; when streaming, stops reading once ``answer_complete(text, stop)``."""
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
-        payload = {
-            "model": self.model,
-            "messages": messages,
-        }
-        response = requests.post(
-            self.base_url,
-            headers=headers,
-            json=payload,
-            timeout=self.timeout,
-        )
+        payload = self.chat_payload(messages)
+        if self.stream:
+            payload["stream"] = True
         try:
-            response.raise_for_status()
+            with self.metrics.timer("glm_chat_seconds", model=self.model):
+                started = time.perf_counter()
+                response = self.session.post(
+                    self.base_url,
+                    headers=headers,
+                    json=payload,
+                    timeout=self.timeout,
+                    stream=self.stream,
+                )
+                if self.stream:
+                    return self._read_stream(response, stop, started)
         except requests.HTTPError as exc:
+            response = exc.response
             error_data = response.json() if response.text else {}
             error_code = error_data.get("error", {}).get("code", "")
             
@@ -110,10 +372,59 @@ class GlmAi:
             raise RuntimeError(
                 f"GLM 接口请求失败 {response.status_code}: {response.text}"
             ) from exc
+        except requests.RequestException as exc:
+            raise RuntimeError(f"GLM 接口请求失败: {exc}") from exc
 
         data = response.json() if response.text else {}
+        self._count_usage(data.get("usage"))
         choices = data.get("choices") or []
         if not choices:
             raise ValueError("GLM 返回为空: {}".format(data))
         message = choices[0].get("message", {})
         return message.get("content", "")
+
+    def _read_stream(self, response: requests.Response, stop: Optional[str],
+                     started: float) -> str:
+        """Collect the deltas of a server-sent event stream, hanging up early on ``stop``."""
+        parts: List[str] = []
+        with response:
+            for line in response.iter_lines():
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                try:
+                    event = json.loads(data)
+                except json.JSONDecodeError:
+                    # Keep-alive or otherwise malformed event; the answer is in the others.
+                    continue
+                self._count_usage(event.get("usage"))
+                for choice in event.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content")
+                    if not delta:
+                        continue
+                    if not parts:
+                        self.metrics.observe("glm_first_token_seconds",
+                                             time.perf_counter() - started, model=self.model)
+                    parts.append(delta)
+                # Only a closing bracket or a newline can complete an answer.
+                if stop and parts and any(char in parts[-1] for char in "}]\n") \
+                        and answer_complete("".join(parts), stop):
+                    self.metrics.inc("glm_early_stops_total", model=self.model)
+                    break
+        return "".join(parts)
+
+    def _count_usage(self, usage: Optional[dict]) -> None:
+        usage = usage or {}
+        for kind in ("prompt", "completion"):
+            if usage.get(f"{kind}_tokens"):
+                self.metrics.inc("glm_tokens_total", usage[f"{kind}_tokens"], kind=kind)
+
+    def _log_retry(self, attempt: int, wait_time: float, exc: requests.RequestException) -> None:
+        self.metrics.inc("retries_total", service="glm")
+        if isinstance(exc, requests.HTTPError):
+            message = f"HTTP {exc.response.status_code}"
+        else:
+            message = str(getattr(exc, "reason", None) or exc)
+        print(f"GLM 请求异常({message})，第 {attempt} 次重试，等待 {wait_time:.1f} 秒")
@@ -0,0 +1,134 @@
+import json
+import os
+import time
+import uuid
+from typing import Iterator, Optional
+
+import custom_requests as requests
+from custom_requests import RetryPolicy
+
+# Batch jobs end in one of these states; anything else is still running.
+FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class GlmBatchClient:
+    """Client for the GLM Batch API: upload a JSONL file, run it, fetch results.
+
+    ``base_url`` defaults to ``GLM_BATCH_BASE_URL`` so a local stand-in server
+    can replace the real endpoint.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        completion_url: str = "/v4/chat/completions",
+        timeout: int = 300,
+    ) -> None:
+        self.api_key = api_key
+        self.base_url = (
+            base_url
+            or os.environ.get("GLM_BATCH_BASE_URL")
+            or "https://open.bigmodel.cn/api/paas/v4"
+        ).rstrip("/")
+        self.completion_url = completion_url
+        self.timeout = timeout
+        self.session = requests.Session(
+            headers={"Authorization": f"Bearer {api_key}"},
+            retry=RetryPolicy(max_attempts=6, backoff_base=2.0, backoff_max=60.0),
+        )
+
+    def request_line(self, custom_id: str, body: dict) -> str:
+        """One line of a batch input file."""
+        return json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": self.completion_url,
+            "body": body,
+        }, ensure_ascii=False)
+
+    def upload(self, path: str) -> str:
+        boundary = uuid.uuid4().hex
+        with open(path, "rb") as f:
+            content = f.read()
+        filename = os.path.basename(path)
+        body = b"".join([
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="purpose"\r\n\r\n'
+            "batch\r\n".encode("utf-8"),
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            "Content-Type: application/jsonl\r\n\r\n".encode("utf-8"),
+            content,
+            f"\r\n--{boundary}--\r\n".encode("utf-8"),
+        ])
+        response = self.session.post(
+            f"{self.base_url}/files",
+            headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+            data=body,
+            timeout=self.timeout,
+        )
+        return response.json()["id"]
+
+    def create(self, input_file_id: str, metadata: Optional[dict] = None) -> dict:
+        payload = {
+            "input_file_id": input_file_id,
+            "endpoint": self.completion_url,
+            "completion_window": "24h",
+        }
+        if metadata:
+            payload["metadata"] = metadata
+        response = self.session.post(
+            f"{self.base_url}/batches", json=payload, timeout=self.timeout
+        )
+        return response.json()
+
+    def retrieve(self, batch_id: str) -> dict:
+        response = self.session.get(f"{self.base_url}/batches/{batch_id}", timeout=self.timeout)
+        return response.json()
+
+    def wait(self, batch_id: str, poll_interval: float = 60.0,
+             timeout: Optional[float] = None) -> dict:
+        """Poll a batch until it reaches a final status and return it."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            batch = self.retrieve(batch_id)
+            status = batch.get("status")
+            counts = batch.get("request_counts") or {}
+            print(f"批处理 {batch_id} 状态: {status} "
+                  f"({counts.get('completed', 0)}/{counts.get('total', '?')})")
+            if status in FINAL_STATUSES:
+                return batch
+            if deadline is not None and time.monotonic() + poll_interval > deadline:
+                raise TimeoutError(f"批处理 {batch_id} 未在限定时间内完成")
+            time.sleep(poll_interval)
+
+    def download(self, file_id: str, path: str) -> str:
+        """Stream a result file to ``path`` without holding it in memory."""
+        response = self.session.get(
+            f"{self.base_url}/files/{file_id}/content", timeout=self.timeout, stream=True
+        )
+        with response, open(path, "wb") as f:
+            for chunk in response.iter_content():
+                f.write(chunk)
+        return path
+
+
+def iter_batch_results(path: str) -> Iterator[dict]:
+    """Yield the result records of a downloaded batch output file."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def result_content(record: dict) -> Optional[str]:
+    """Message content of a successful batch result record, otherwise None."""
+    response = record.get("response") or {}
+    if response.get("status_code", 200) != 200:
+        return None
+    choices = (response.get("body") or {}).get("choices") or []
+    if not choices:
+        return None
+    return choices[0].get("message", {}).get("content")
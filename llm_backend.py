@@ -0,0 +1,252 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Deque, Dict, List, Optional, Tuple
+
+from glm_ai import GlmAi, answer_line
+from metrics import Metrics
+from structured_output import parse_structured
+
+# How often a call checks whether its queued first attempt has started running.
+_QUEUED_POLL_SECONDS = 0.05
+
+# Provider name -> (base URL variable, default base URL, API key variable, default model).
+PROVIDERS = {
+    "glm": ("GLM_BASE_URL", "https://open.bigmodel.cn/api/paas/v4/chat/completions",
+            "GLM_API_KEY", "glm-4.5-air"),
+    "deepseek": ("DEEPSEEK_BASE_URL", "https://api.deepseek.com/chat/completions",
+                 "DEEPSEEK_API_KEY", "deepseek-chat"),
+    # Ollama's OpenAI-compatible API under OLLAMA_HOST; it needs no key.
+    "ollama": (None, None, None, "qwen2.5"),
+}
+
+
+def make_provider(spec: str, **client_args) -> GlmAi:
+    """Chat client for a ``name`` or ``name:model`` spec, e.g. ``deepseek`` or ``ollama:qwen2.5``.
+
+    ``client_args`` are passed on to ``GlmAi`` (timeout, stream, metrics, ...).
+    """
+    name, _, model = spec.strip().partition(":")
+    if name not in PROVIDERS:
+        raise ValueError(f"unknown LLM provider {name!r}, expected one of {', '.join(PROVIDERS)}")
+    url_variable, default_url, key_variable, default_model = PROVIDERS[name]
+    if name == "ollama":
+        host = os.environ.get("OLLAMA_HOST") or "127.0.0.1:11434"
+        if "://" not in host:
+            host = f"http://{host}"
+        base_url = f"{host.rstrip('/')}/v1/chat/completions"
+        api_key = "ollama"
+    else:
+        base_url = os.environ.get(url_variable) or default_url
+        api_key = os.environ.get(key_variable)
+        if not api_key:
+            raise ValueError(f"{key_variable} is required for the {name} provider")
+    return GlmAi(api_key=api_key, model=model or default_model, base_url=base_url, **client_args)
+
+
+def make_providers(specs: str, **client_args) -> Dict[str, GlmAi]:
+    """Clients for comma-separated provider specs, in order of preference."""
+    return {
+        spec.strip(): make_provider(spec, **client_args)
+        for spec in specs.split(",") if spec.strip()
+    }
+
+
+class LlmAnswerError(ValueError):
+    """No provider gave a usable answer to a prompt: each refused it or answered unusably.
+
+    A ``ValueError``, like the content-filter and parse errors of a single
+    ``GlmAi``, so callers skip the prompt's page rather than stop the run.
+    """
+
+
+def _valid_answer(text: str, stop: Optional[str]) -> bool:
+    if not text or not text.strip():
+        return False
+    if stop == "line":
+        return bool(answer_line(text))
+    if stop in ("json", "array"):
+        try:
+            value = parse_structured(text, list if stop == "array" else dict)
+        except ValueError:
+            return False
+        # classify_batch also takes an object wrapping the array.
+        return stop == "array" or isinstance(value, dict)
+    return True
+
+
+class ProviderHealth:
+    """Recent latencies and consecutive failures of one provider.
+
+    After ``failure_threshold`` failures in a row the provider is marked down
+    for ``cooldown`` seconds, doubling with every further failure, and is
+    tried again once the time has passed.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 10,
+                 failure_threshold: int = 3, cooldown: float = 30.0,
+                 max_cooldown: float = 600.0) -> None:
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+            self.failures = 0
+            self._down_until = 0.0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                backoff = self.cooldown * 2 ** (self.failures - self.failure_threshold)
+                self._down_until = time.monotonic() + min(backoff, self.max_cooldown)
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Latency quantile over the recent window, once enough requests succeeded."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class FailoverBackend:
+    """Answers chat prompts from several providers, hedging slow calls and skipping failed ones.
+
+    Pass an instance as ``GlmAi(backend=...)``. Each call goes to the first
+    healthy provider. When it is still running after its recent
+    ``hedge_quantile`` latency, the same request is sent to the next provider,
+    and the first valid answer wins. Until a provider has enough samples the
+    lowest such latency of the other providers is used instead, or
+    ``initial_hedge_after`` seconds when none has any. A failed or invalid
+    answer moves on to the next provider right away. Providers that keep
+    failing are skipped for a while (see ``ProviderHealth``) and only used
+    when no healthy one is left; a provider refusing a prompt, e.g. by its
+    content filter, does not count as failing.
+
+    Calls return the answer and the model that wrote it. When every provider
+    fails, ``LlmAnswerError`` is raised if any of them refused the prompt or
+    answered unusably, and ``RuntimeError`` if all were unreachable.
+    """
+
+    def __init__(self, providers: Dict[str, GlmAi], hedge_quantile: float = 0.95,
+                 initial_hedge_after: float = 15.0, metrics: Optional[Metrics] = None,
+                 concurrency: int = 8, **health_args) -> None:
+        if not providers:
+            raise ValueError("at least one LLM provider is required")
+        self.providers = providers
+        self.hedge_quantile = hedge_quantile
+        self.initial_hedge_after = initial_hedge_after
+        self.metrics = metrics or Metrics()
+        self.health = {name: ProviderHealth(**health_args) for name in providers}
+        # Hedged requests that lose keep running here until they finish, so
+        # their latency still feeds the provider's health. Each of the
+        # ``concurrency`` calls made at once can use every provider.
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency) * len(providers),
+                                            thread_name_prefix="llm")
+
+    @property
+    def models(self) -> List[str]:
+        """Models of the providers, in order of preference."""
+        return list(dict.fromkeys(client.model for client in self.providers.values()))
+
+    def __call__(self, messages: List[dict], stop: Optional[str] = None) -> Tuple[str, str]:
+        remaining = self._order()
+        pending: Dict[Future, str] = {}
+        # When each attempt started running; a busy pool may queue it first.
+        started: Dict[str, float] = {}
+        errors: Dict[str, Exception] = {}
+
+        def launch() -> None:
+            name = remaining.pop(0)
+            future = self._executor.submit(self._attempt, name, messages, stop, started)
+            pending[future] = name
+
+        launch()
+        while pending:
+            timeout = None
+            hedge = False
+            if remaining and len(pending) == 1:
+                name = next(iter(pending.values()))
+                if name in started:
+                    timeout = max(0.0, started[name] + self._hedge_after(name) - time.monotonic())
+                    hedge = True
+                else:
+                    # The hedge clock only starts once the attempt is running.
+                    timeout = _QUEUED_POLL_SECONDS
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if hedge:
+                    self.metrics.inc("llm_hedges_total", provider=remaining[0])
+                    launch()
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    return future.result(), self.providers[name].model
+                except Exception as exc:
+                    errors[name] = exc
+                    print(f"LLM 提供方 {name} 调用失败: {exc}")
+            if not pending and remaining:
+                self.metrics.inc("llm_failovers_total", provider=remaining[0])
+                launch()
+        detail = "; ".join(f"{name}: {exc}" for name, exc in errors.items())
+        # A refused or unusable answer means this prompt is the problem, not the providers.
+        rejected = [exc for exc in errors.values() if isinstance(exc, ValueError)]
+        if rejected:
+            raise LlmAnswerError(f"所有 LLM 提供方均无法处理: {detail}") from rejected[-1]
+        raise RuntimeError(f"所有 LLM 提供方均调用失败: {detail}") from list(errors.values())[-1]
+
+    def _hedge_after(self, name: str) -> float:
+        own = self.health[name].quantile(self.hedge_quantile)
+        if own is not None:
+            return own
+        known = [latency for latency in (health.quantile(self.hedge_quantile)
+                                         for health in self.health.values())
+                 if latency is not None]
+        return min(known) if known else self.initial_hedge_after
+
+    def _order(self) -> List[str]:
+        healthy = [name for name in self.providers if self.health[name].healthy]
+        return healthy + [name for name in self.providers if name not in healthy]
+
+    def _attempt(self, name: str, messages: List[dict], stop: Optional[str],
+                 running: Dict[str, float]) -> str:
+        running[name] = time.monotonic()
+        health = self.health[name]
+        started = time.perf_counter()
+        try:
+            text = self.providers[name].chat(messages, stop)
+        except ValueError:
+            # Refused this prompt, e.g. by a content filter; the provider itself works.
+            self.metrics.inc("llm_requests_total", provider=name, result="rejected")
+            raise
+        except Exception:
+            health.record_failure()
+            self.metrics.inc("llm_requests_total", provider=name, result="failed")
+            raise
+        if not _valid_answer(text, stop):
+            health.record_failure()
+            self.metrics.inc("llm_requests_total", provider=name, result="invalid")
+            raise ValueError(f"无效输出: {text[:200]}")
+        elapsed = time.perf_counter() - started
+        health.record_success(elapsed)
+        self.metrics.observe("llm_request_seconds", elapsed, provider=name)
+        self.metrics.inc("llm_requests_total", provider=name, result="ok")
+        return text
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,227 @@
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+_ID_SEGMENT_RE = re.compile(r"^(?=.*\d)[0-9A-Za-z_-]{16,}$|^\d+$")
+
+
+def endpoint_label(url: str) -> str:
+    """``host/path`` of a URL with id-like path segments replaced by ``{id}``."""
+    parts = urlsplit(url)
+    segments = [
+        "{id}" if _ID_SEGMENT_RE.match(segment) else segment
+        for segment in parts.path.split("/")
+    ]
+    return f"{parts.hostname or ''}{'/'.join(segments)}"
+
+
+class Histogram:
+    """Count, sum and extremes of observed values plus a bounded sample for quantiles.
+
+    Once more than ``max_samples`` values were observed the sample is a uniform
+    reservoir, so memory stays constant however long the run is.
+    """
+
+    def __init__(self, max_samples: int = 10_000) -> None:
+        self.max_samples = max_samples
+        self.count = 0
+        self.sum = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._samples: List[float] = []
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if len(self._samples) < self.max_samples:
+            self._samples.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < self.max_samples:
+                self._samples[index] = value
+
+    def quantiles(self, qs=QUANTILES) -> Dict[str, Optional[float]]:
+        ordered = sorted(self._samples)
+        return {
+            str(q): ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else None
+            for q in qs
+        }
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "quantiles": self.quantiles(),
+        }
+
+
+class Metrics:
+    """Thread-safe in-process counters and latency histograms for one run.
+
+    Series are identified by a metric name plus keyword labels, e.g.
+    ``metrics.observe("glm_chat_seconds", 1.2, model="glm-4.5-air")``.
+    """
+
+    def __init__(self, max_samples: int = 10_000) -> None:
+        self.max_samples = max_samples
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[_LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[_LabelKey, Histogram]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, object]) -> _LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.max_samples)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe the wall time of the ``with`` block in seconds, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def observe_http(self, method: str, url: str, status: Optional[int], elapsed: float) -> None:
+        """``Session(on_request=...)`` hook recording every HTTP attempt."""
+        endpoint = endpoint_label(url)
+        self.observe("http_request_seconds", elapsed, method=method, endpoint=endpoint)
+        self.inc("http_requests_total", method=method, endpoint=endpoint,
+                 status=status if status is not None else "error")
+
+    def counter(self, name: str, **labels) -> float:
+        """Sum of the counter series carrying all of ``labels``; all series without labels."""
+        wanted = set(self._key(labels))
+        with self._lock:
+            series = self._counters.get(name, {})
+            return sum(value for key, value in series.items() if wanted.issubset(key))
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def pages_per_minute(self) -> float:
+        minutes = self.elapsed() / 60
+        return self.counter("pages_total") / minutes if minutes > 0 else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: [{"labels": dict(key), **histogram.snapshot()}
+                       for key, histogram in series.items()]
+                for name, series in self._histograms.items()
+            }
+        return {
+            "elapsed_seconds": self.elapsed(),
+            "pages_per_minute": self.pages_per_minute(),
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        lines = [
+            f"运行耗时 {snapshot['elapsed_seconds']:.1f} 秒，"
+            f"处理速度 {snapshot['pages_per_minute']:.1f} 页/分钟"
+        ]
+        for name, series in sorted(snapshot["counters"].items()):
+            for entry in series:
+                lines.append(f"  {name}{_format_labels(entry['labels'])} {entry['value']:g}")
+        for name, series in sorted(snapshot["histograms"].items()):
+            unit = _unit(name)
+            for entry in series:
+                quantiles = " ".join(
+                    f"p{int(float(q) * 100)}={value:.3f}{unit}"
+                    for q, value in entry["quantiles"].items() if value is not None
+                )
+                lines.append(
+                    f"  {name}{_format_labels(entry['labels'])} "
+                    f"count={entry['count']} {quantiles} max={entry['max']:.3f}{unit}"
+                )
+        return "\n".join(lines)
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition; histograms are exported as summaries."""
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE run_elapsed_seconds gauge",
+            f"run_elapsed_seconds {snapshot['elapsed_seconds']}",
+            "# TYPE pages_per_minute gauge",
+            f"pages_per_minute {snapshot['pages_per_minute']}",
+        ]
+        for name, series in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {name} counter")
+            for entry in series:
+                lines.append(f"{name}{_prometheus_labels(entry['labels'])} {entry['value']}")
+        for name, series in sorted(snapshot["histograms"].items()):
+            lines.append(f"# TYPE {name} summary")
+            for entry in series:
+                for q, value in entry["quantiles"].items():
+                    if value is None:
+                        continue
+                    labels = _prometheus_labels({**entry["labels"], "quantile": q})
+                    lines.append(f"{name}{labels} {value}")
+                labels = _prometheus_labels(entry["labels"])
+                lines.append(f"{name}_sum{labels} {entry['sum']}")
+                lines.append(f"{name}_count{labels} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """Write the metrics to ``path``: Prometheus text for ``.prom``/``.txt``, else JSON."""
+        if path.endswith((".prom", ".txt")):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+def _unit(name: str) -> str:
+    """Suffix for printed values; only ``*_seconds`` histograms carry a unit."""
+    return "s" if name.endswith("_seconds") else ""
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f"{name}={value}" for name, value in labels.items()) + "}"
+
+
+def _prometheus_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
@@ -0,0 +1,205 @@
+import json
+import sqlite3
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from notion_api import iter_query_pages
+from sync_state import incremental_query
+
+# Page properties mirrored into their own indexed columns, with how to read them.
+_COLUMNS = {
+    "name": lambda props: _plain_text(props.get("Name", {}).get("title")),
+    "summary": lambda props: _plain_text(props.get("summary", {}).get("rich_text")),
+    "tags": lambda props: _plain_text(props.get("Tags", {}).get("rich_text")),
+    "classify": lambda props: (props.get("Classfiy", {}).get("select") or {}).get("name"),
+    "updated": lambda props: int(bool(props.get("updated", {}).get("checkbox"))),
+    "marked": lambda props: int(bool(props.get("marked", {}).get("checkbox"))),
+}
+# Notion property name -> mirror column, for translating query filters.
+_FILTER_COLUMNS = {"Classfiy": "classify", "updated": "updated", "marked": "marked"}
+
+
+def _plain_text(rich_text: Optional[List[dict]]) -> str:
+    return "".join(item.get("plain_text", "") for item in rich_text or [])
+
+
+def page_columns(page: dict) -> dict:
+    """The mirrored property values of a Notion page object, by column name."""
+    props = page.get("properties") or {}
+    return {column: read(props) for column, read in _COLUMNS.items()}
+
+
+def page_removed(page: dict) -> bool:
+    """Whether a Notion page object is archived or in the trash."""
+    return bool(page.get("archived") or page.get("in_trash"))
+
+
+class UnsupportedFilter(ValueError):
+    """A Notion filter that the mirror cannot evaluate locally."""
+
+
+class NotionMirror:
+    """Local SQLite copy of Notion database pages and their properties.
+
+    ``sync`` pulls pages edited since the last sync of a database, so keeping
+    the mirror current costs one query per changed page batch. ``query``
+    answers the ``checkbox``/``select`` filters used by this repository from
+    indexed columns, returning the stored page objects unchanged. Writes still
+    go to the API; callers hand the returned page to ``upsert`` so the mirror
+    reflects them without another sync. Database queries never return
+    deleted or archived pages, so callers that find a page gone (see
+    ``notion_api.page_gone``) ``remove`` it.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " id TEXT PRIMARY KEY,"
+            " database TEXT NOT NULL,"
+            " last_edited_time TEXT NOT NULL,"
+            " name TEXT, summary TEXT, tags TEXT, classify TEXT,"
+            " updated INTEGER NOT NULL DEFAULT 0,"
+            " marked INTEGER NOT NULL DEFAULT 0,"
+            " page TEXT NOT NULL)"
+        )
+        for column in ("classify", "updated", "marked", "last_edited_time"):
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS pages_{column} ON pages (database, {column})"
+            )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " database TEXT PRIMARY KEY,"
+            " last_edited_time TEXT NOT NULL)"
+        )
+
+    def sync(self, database: str, fetch: Callable[[dict], dict]) -> int:
+        """Mirror pages of ``database`` edited since the last sync; returns how many."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_edited_time FROM watermarks WHERE database = ?", (database,)
+            ).fetchone()
+        watermark = row[0] if row else None
+        count = 0
+        batch = []
+        for page in iter_query_pages(fetch, incremental_query(watermark)):
+            batch.append(page)
+            if len(batch) >= 500:
+                watermark = self._store(database, batch, watermark)
+                count += len(batch)
+                batch = []
+        if batch:
+            watermark = self._store(database, batch, watermark)
+            count += len(batch)
+        return count
+
+    def _store(self, database: str, pages: List[dict], watermark: Optional[str]) -> Optional[str]:
+        newest = max([watermark or ""] + [page.get("last_edited_time", "") for page in pages])
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO pages (id, database, last_edited_time, name, summary, tags,"
+                " classify, updated, marked, page) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (id) DO UPDATE SET database = excluded.database,"
+                " last_edited_time = excluded.last_edited_time, name = excluded.name,"
+                " summary = excluded.summary, tags = excluded.tags,"
+                " classify = excluded.classify, updated = excluded.updated,"
+                " marked = excluded.marked, page = excluded.page",
+                [self._row(database, page) for page in pages],
+            )
+            # Pages archived or trashed in a sync batch leave no trace in later queries.
+            self._conn.executemany(
+                "DELETE FROM pages WHERE id = ?",
+                [(page["id"],) for page in pages if page_removed(page)],
+            )
+            if newest:
+                self._conn.execute(
+                    "INSERT INTO watermarks (database, last_edited_time) VALUES (?, ?)"
+                    " ON CONFLICT (database) DO UPDATE SET"
+                    " last_edited_time = excluded.last_edited_time",
+                    (database, newest),
+                )
+            self._conn.execute("COMMIT")
+        return newest or None
+
+    @staticmethod
+    def _row(database: str, page: dict) -> tuple:
+        return (
+            page["id"], database, page.get("last_edited_time", ""),
+            *page_columns(page).values(),
+            json.dumps(page, ensure_ascii=False),
+        )
+
+    def upsert(self, page: dict) -> None:
+        """Refresh a mirrored page from an API response, e.g. the result of a PATCH."""
+        if not page.get("id") or "properties" not in page:
+            return
+        if page_removed(page):
+            self.remove(page["id"])
+            return
+        assignments = ", ".join(f"{column} = ?" for column in _COLUMNS)
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE pages SET last_edited_time = ?, {assignments}, page = ? WHERE id = ?",
+                (page.get("last_edited_time", ""), *page_columns(page).values(),
+                 json.dumps(page, ensure_ascii=False), page["id"]),
+            )
+
+    def remove(self, page_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE id = ?", (page_id,))
+
+    def query(self, database: str, condition: Optional[dict] = None) -> List[dict]:
+        """Pages of ``database`` matching a Notion ``filter``, oldest edit first."""
+        where, params = self._where(condition)
+        sql = "SELECT page FROM pages WHERE database = ?"
+        if where:
+            sql += f" AND {where}"
+        sql += " ORDER BY last_edited_time"
+        with self._lock:
+            rows = self._conn.execute(sql, (database, *params)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def supports(self, condition: Optional[dict]) -> bool:
+        try:
+            self._where(condition)
+        except UnsupportedFilter:
+            return False
+        return True
+
+    def _where(self, condition: Optional[dict]) -> Tuple[str, list]:
+        if not condition:
+            return "", []
+        for combinator in ("and", "or"):
+            if combinator in condition:
+                parts = [self._where(part) for part in condition[combinator]]
+                sql = f" {combinator.upper()} ".join(f"({where})" for where, _ in parts if where)
+                return sql, [param for _, params in parts for param in params]
+        column = _FILTER_COLUMNS.get(condition.get("property"))
+        if column in ("updated", "marked") and "checkbox" in condition:
+            equals = condition["checkbox"].get("equals")
+            if equals is not None:
+                return f"{column} = ?", [int(bool(equals))]
+        if column == "classify" and "select" in condition:
+            select = condition["select"]
+            if select.get("is_empty"):
+                return "classify IS NULL", []
+            if select.get("is_not_empty"):
+                return "classify IS NOT NULL", []
+            if "equals" in select:
+                return "classify = ?", [select["equals"]]
+        raise UnsupportedFilter(f"filter not supported by the mirror: {condition}")
+
+    def count(self, database: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM pages WHERE database = ?", (database,)
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
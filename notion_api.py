@@ -0,0 +1,161 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from custom_requests import HTTPError, RateLimiter, RequestException, RetryPolicy
+
+NOTION_API_HOST = "api.notion.com"
+NOTION_API_BASE = f"https://{NOTION_API_HOST}/v1"
+# Notion allows an average of three requests per second per integration.
+NOTION_REQUESTS_PER_SECOND = 3.0
+NOTION_MAX_PAGE_SIZE = 100
+
+# Block types whose children are separate pages or databases, not page content.
+_SEPARATE_CHILDREN = ("child_page", "child_database")
+
+# Shared by every Notion client in the process so the limit holds across them.
+notion_rate_limiter = RateLimiter({NOTION_API_HOST: NOTION_REQUESTS_PER_SECOND})
+
+
+def notion_base_url(base_url: Optional[str] = None) -> str:
+    """API root to use; ``NOTION_API_BASE`` lets a local stand-in server replace Notion."""
+    return (base_url or os.environ.get("NOTION_API_BASE") or NOTION_API_BASE).rstrip("/")
+
+
+def page_gone(exc: Optional[BaseException]) -> bool:
+    """Whether a failed Notion request, or an error raised from one, means the page is gone.
+
+    Notion answers 404 for deleted pages and pages no longer shared with the
+    integration, and 400 for writes to archived ones.
+    """
+    while exc is not None and not isinstance(exc, HTTPError):
+        exc = exc.__cause__
+    if exc is None or exc.response is None:
+        return False
+    status = exc.response.status_code
+    return status == 404 or (status == 400 and "archived" in exc.response.text)
+
+
+def notion_retry_policy(
+    on_retry: Optional[Callable[[int, float, RequestException], None]] = None,
+    call_timeout: Optional[float] = 600,
+    run_timeout: Optional[float] = None,
+) -> RetryPolicy:
+    """Retry policy for Notion calls, throttled to the integration rate limit."""
+    return RetryPolicy(
+        max_attempts=None,
+        backoff_base=1.0,
+        backoff_max=30.0,
+        call_timeout=call_timeout,
+        run_timeout=run_timeout,
+        rate_limiter=notion_rate_limiter,
+        on_retry=on_retry,
+    )
+
+
+def iter_query_batches(
+    fetch: Callable[[dict], dict],
+    query: Optional[dict] = None,
+    start_cursor: Optional[str] = None,
+    prefetch: bool = True,
+) -> Iterator[List[dict]]:
+    """Yield the result batches of a Notion database query, one per cursor page.
+
+    ``fetch`` posts a query body and returns the decoded response. With
+    ``prefetch`` the next cursor page is requested in the background while the
+    caller is still working on the current batch.
+    """
+
+    def fetch_batch(cursor: Optional[str]) -> dict:
+        body = dict(query or {})
+        body['page_size'] = NOTION_MAX_PAGE_SIZE
+        if cursor:
+            body['start_cursor'] = cursor
+        return fetch(body)
+
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        payload = fetch_batch(start_cursor)
+        while True:
+            next_cursor = payload.get('next_cursor') if payload.get('has_more') else None
+            upcoming = executor.submit(fetch_batch, next_cursor) if executor and next_cursor else None
+            yield payload.get('results', [])
+            if not next_cursor:
+                return
+            payload = upcoming.result() if upcoming else fetch_batch(next_cursor)
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_query_pages(
+    fetch: Callable[[dict], dict],
+    query: Optional[dict] = None,
+    start_cursor: Optional[str] = None,
+    prefetch: bool = True,
+) -> Iterator[dict]:
+    """Flattened ``iter_query_batches``: yield the pages of a query one by one."""
+    for batch in iter_query_batches(fetch, query, start_cursor, prefetch):
+        yield from batch
+
+
+def block_text(block: dict) -> str:
+    """Plain text of one block: all rich-text segments, table cells or equations."""
+    kind = block.get("type")
+    value = block.get(kind) if kind else None
+    if not isinstance(value, dict):
+        return ""
+    if kind == "table_row":
+        return " | ".join(_plain_text(cell) for cell in value.get("cells") or [])
+    if kind == "equation":
+        return value.get("expression") or ""
+    if kind == "child_page":
+        return value.get("title") or ""
+    return _plain_text(value.get("rich_text") or [])
+
+
+def _plain_text(rich_text: List[dict]) -> str:
+    return "".join(segment.get("plain_text", "") for segment in rich_text)
+
+
+def iter_block_text(
+    fetch: Callable[[str, Optional[str]], dict],
+    block_id: str,
+    concurrency: int = 8,
+) -> Iterator[str]:
+    """Yield the text of every block under ``block_id`` in document order.
+
+    ``fetch(block_id, cursor)`` returns one page of a block's children. The
+    tree is walked breadth-first: as soon as a page of children arrives, the
+    children of its nested blocks are requested on a pool of ``concurrency``
+    threads, so a deeply nested page takes about as long as its deepest path.
+    Text is streamed out as soon as everything before it has been fetched.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+
+    def expand(parent_id: str) -> List[Tuple[dict, Optional[Future]]]:
+        entries = []
+        cursor = None
+        while True:
+            payload = fetch(parent_id, cursor)
+            for block in payload.get("results", []):
+                child = None
+                if block.get("has_children") and block.get("type") not in _SEPARATE_CHILDREN:
+                    child = executor.submit(expand, block["id"])
+                entries.append((block, child))
+            cursor = payload.get("next_cursor") if payload.get("has_more") else None
+            if not cursor:
+                return entries
+
+    def walk(entries: List[Tuple[dict, Optional[Future]]]) -> Iterator[str]:
+        for block, child in entries:
+            text = block_text(block)
+            if text:
+                yield text
+            if child is not None:
+                yield from walk(child.result())
+
+    try:
+        yield from walk(expand(block_id))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,18 @@
 import argparse
 import os
 import sys
+import traceback
 
 from dotenv import load_dotenv
 
+from checkpoint import CheckpointJournal
 from cliper import Cliper
+from glm_batch import GlmBatchClient
+from llm_backend import FailoverBackend, make_providers
+from metrics import Metrics
+from mirror import NotionMirror
+from search_index import SearchIndex
+from sync_state import SyncState
 
 
 def parse_args() -> argparse.Namespace:
@@ -35,9 +43,185 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Optional Notion pagination cursor if you want to resume from a previous run",
     )
+    parser.add_argument(
+        "--run-timeout",
+        type=float,
+        default=None,
+        help="Stop retrying failed Notion/GLM requests once the run has lasted this many seconds",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of pages processed in parallel (default: 1, sequential)",
+    )
+    parser.add_argument(
+        "--glm-concurrency",
+        type=int,
+        default=None,
+        help="Maximum in-flight GLM requests (default: same as --workers)",
+    )
+    parser.add_argument(
+        "--notion-concurrency",
+        type=int,
+        default=3,
+        help="Maximum in-flight Notion requests (default: 3)",
+    )
+    parser.add_argument(
+        "--cache-file",
+        default=".glm_cache.sqlite3",
+        help="SQLite file caching GLM results across runs (default: .glm_cache.sqlite3)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable the GLM result cache",
+    )
+    parser.add_argument(
+        "--separate-calls",
+        action="store_true",
+        help="Use separate GLM calls for summary/tags and classification instead of one",
+    )
+    parser.add_argument(
+        "--batch-classify",
+        action="store_true",
+        help="Classify each query batch with multi-page GLM prompts instead of one call per page",
+    )
+    parser.add_argument(
+        "--classify-token-budget",
+        type=int,
+        default=4000,
+        help="Approximate prompt token budget per batched classification request (default: 4000)",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help=(
+            "Process unprocessed pages offline through the GLM Batch API: export requests, "
+            "submit, poll for completion and apply the results"
+        ),
+    )
+    parser.add_argument(
+        "--batch-file",
+        default="glm_batch_requests.jsonl",
+        help="JSONL file the batch requests are written to (default: glm_batch_requests.jsonl)",
+    )
+    parser.add_argument(
+        "--batch-id",
+        default=None,
+        help="Resume polling and applying an already submitted batch instead of exporting a new one",
+    )
+    parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between batch status polls (default: 60)",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help=(
+            "Incremental sync: only query pages edited since the last sync and redo those "
+            "whose summary changed, including already updated pages"
+        ),
+    )
+    parser.add_argument(
+        "--sync-state",
+        default=".cliper_sync.sqlite3",
+        help="SQLite file holding the sync high-water mark and summary hashes (default: .cliper_sync.sqlite3)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help=(
+            "Stream GLM completions and stop reading as soon as the JSON answer or "
+            "category line is complete"
+        ),
+    )
+    parser.add_argument(
+        "--llm-providers",
+        default=None,
+        help=(
+            "Comma-separated LLM providers in order of preference, e.g. "
+            "'glm,deepseek,ollama:qwen2.5'; slow calls are hedged to the next provider "
+            "and failed ones fail over (default: GLM only)"
+        ),
+    )
+    parser.add_argument(
+        "--mirror",
+        default=None,
+        metavar="PATH",
+        help=(
+            "Keep a local SQLite mirror of the database at PATH (e.g. .notion_mirror.sqlite3) "
+            "and select pending pages from it instead of paging through the Notion query API"
+        ),
+    )
+    parser.add_argument(
+        "--search-index",
+        default=None,
+        metavar="PATH",
+        help=(
+            "Update the full-text search index at PATH (e.g. .clips_index.sqlite3) "
+            "with every page written; query it with search_clips.py"
+        ),
+    )
+    parser.add_argument(
+        "--journal",
+        default=".cliper_journal.jsonl",
+        help="Checkpoint journal recording each page's progress (default: .cliper_journal.jsonl)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the existing journal instead of starting a fresh one",
+    )
+    parser.add_argument(
+        "--compact-journal",
+        action="store_true",
+        help="Rewrite the journal as one record per page and exit",
+    )
+    parser.add_argument(
+        "--metrics-out",
+        default=None,
+        help=(
+            "Write run metrics to this file: Prometheus text for .prom/.txt paths, "
+            "JSON otherwise"
+        ),
+    )
     return parser.parse_args()
 
 
+def run_batch(cliper: Cliper, database_url, args: argparse.Namespace) -> int:
+    client = GlmBatchClient(cliper.ai.api_key)
+    batch_id = args.batch_id
+    if not batch_id:
+        if not database_url:
+            print("未提供 database_url，且 NOTION_DATABASE_URL 未设置", file=sys.stderr)
+            return 2
+        count = cliper.export_batch_requests(
+            database_url, args.batch_file, client, args.start_cursor
+        )
+        if not count:
+            print('没有可处理的记录')
+            return 0
+        file_id = client.upload(args.batch_file)
+        batch_id = client.create(file_id, metadata={"source": "run_cliper"})["id"]
+        print(f"已提交批处理 {batch_id}，共 {count} 条请求")
+
+    batch = client.wait(batch_id, poll_interval=args.batch_poll_interval)
+    if batch.get("status") != "completed" or not batch.get("output_file_id"):
+        print(f"批处理 {batch_id} 未成功完成: {batch.get('status')}")
+        return 1
+
+    results_file = f"{os.path.splitext(args.batch_file)[0]}.{batch_id}.results.jsonl"
+    client.download(batch["output_file_id"], results_file)
+    applied = cliper.apply_batch_results(results_file)
+    print(f"已应用 {applied} 条批处理结果")
+    if batch.get("error_file_id"):
+        print(f"部分请求失败，错误文件 ID: {batch['error_file_id']}")
+    return 0
+
+
 def main() -> int:
     args = parse_args()
 
@@ -46,9 +230,60 @@ def main() -> int:
     else:
         load_dotenv()
 
-    cliper = Cliper(env_file=args.env_file)
+    if args.compact_journal:
+        journal = CheckpointJournal(args.journal, resume=True)
+        pages = journal.compact()
+        journal.close()
+        print(f"日志已压缩，共 {pages} 个页面")
+        return 0
 
     page_id = args.page_id or os.environ.get("NOTION_PAGE_ID")
+    # Only a fresh database scan starts a new journal; single-page updates and
+    # batches must not discard the progress of an interrupted scan.
+    resume = args.resume or bool(page_id) or args.batch or bool(args.batch_id)
+    journal = CheckpointJournal(args.journal, resume=resume)
+    metrics = Metrics()
+    llm_backend = None
+    if args.llm_providers:
+        llm_backend = FailoverBackend(
+            make_providers(args.llm_providers, env_file=args.env_file,
+                           run_timeout=args.run_timeout, stream=args.stream, metrics=metrics),
+            metrics=metrics,
+            concurrency=args.glm_concurrency or args.workers,
+        )
+    cliper = Cliper(
+        env_file=args.env_file,
+        run_timeout=args.run_timeout,
+        workers=args.workers,
+        glm_concurrency=args.glm_concurrency,
+        notion_concurrency=args.notion_concurrency,
+        cache_path=None if args.no_cache else args.cache_file,
+        combined_analysis=not args.separate_calls,
+        batch_classify=args.batch_classify,
+        classify_token_budget=args.classify_token_budget,
+        journal=journal,
+        metrics=metrics,
+        stream=args.stream,
+        llm_backend=llm_backend,
+        mirror=NotionMirror(args.mirror) if args.mirror else None,
+        search_index=SearchIndex(args.search_index) if args.search_index else None,
+    )
+    try:
+        return run(cliper, page_id, args)
+    finally:
+        if llm_backend is not None:
+            llm_backend.close()
+        if cliper.mirror is not None:
+            cliper.mirror.close()
+        if cliper.search_index is not None:
+            cliper.search_index.close()
+        journal.close()
+        print(cliper.metrics.summary())
+        if args.metrics_out:
+            cliper.metrics.dump(args.metrics_out)
+
+
+def run(cliper: Cliper, page_id, args: argparse.Namespace) -> int:
     if page_id:
         try:
             cliper.update_single_clip(page_id)
@@ -58,17 +293,33 @@ def main() -> int:
         return 0
 
     database_url = args.database_url or os.environ.get("NOTION_DATABASE_URL")
+    if args.batch or args.batch_id:
+        try:
+            return run_batch(cliper, database_url, args)
+        except Exception as exc:
+            print(f"批处理失败: {exc}")
+            return 1
+
     if not database_url:
         print("未提供 page_id 或 database_url，且相关环境变量未设置", file=sys.stderr)
         return 2
 
+    state = SyncState(args.sync_state) if args.sync else None
     try:
-        cliper.update_web_clips(database_url, args.start_cursor)
+        if state is not None:
+            cliper.sync_web_clips(database_url, state)
+        else:
+            cliper.update_web_clips(database_url, args.start_cursor)
     except Exception as exc:
         print(f"处理失败: {exc}")
-        import traceback
         traceback.print_exc()
         return 1
+    finally:
+        if state is not None:
+            state.close()
+        if cliper.cache is not None:
+            stats = cliper.cache.stats()
+            print(f"GLM 缓存命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
     return 0
 
 
@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import time
+
+from search_index import SearchIndex
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Full-text search over clipped Notion pages (titles, summaries, tags and content)"
+    )
+    parser.add_argument(
+        "query",
+        nargs="*",
+        help="Search terms; all must match. Chinese is matched as substrings, 'term*' as a prefix",
+    )
+    parser.add_argument(
+        "--index",
+        default=".clips_index.sqlite3",
+        help="SQLite full-text index file (default: .clips_index.sqlite3)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=20,
+        help="Maximum number of results (default: 20)",
+    )
+    parser.add_argument(
+        "--build",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="DATABASE_URL",
+        help=(
+            "First index pages of this Notion database query URL (default: NOTION_DATABASE_URL) "
+            "edited since the last build, including their content"
+        ),
+    )
+    parser.add_argument(
+        "--env-file",
+        default=None,
+        help="Path to a .env file to load before building (defaults to .env in cwd)",
+    )
+    return parser.parse_args()
+
+
+def build(index: SearchIndex, args: argparse.Namespace) -> int:
+    from webcliper import WebCliper
+
+    database_url = args.build or os.environ.get("NOTION_DATABASE_URL")
+    if not database_url:
+        print("未提供 database_url，且 NOTION_DATABASE_URL 未设置", file=sys.stderr)
+        return 2
+    cliper = WebCliper(env_file=args.env_file, search_index=index)
+    count = cliper.index_articles(database_url)
+    print(f"已索引 {count} 个页面，索引共 {index.count()} 个页面")
+    return 0
+
+
+def main() -> int:
+    args = parse_args()
+    index = SearchIndex(args.index)
+    try:
+        if args.build is not None:
+            status = build(index, args)
+            if status:
+                return status
+        if not args.query:
+            return 0
+
+        started = time.perf_counter()
+        results = index.search(" ".join(args.query), args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        for page_id, title, score in results:
+            print(f"{page_id}\t{-score:.3f}\t{title}")
+        print(f"共 {len(results)} 条结果，耗时 {elapsed:.1f} 毫秒", file=sys.stderr)
+        return 0 if results else 1
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
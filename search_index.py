@@ -0,0 +1,189 @@
+import re
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+from mirror import page_columns, page_removed
+
+# Han, kana and hangul: scripts written without spaces between words.
+_CJK_RUN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+")
+_QUERY_TERM = re.compile(r"\w+\*?")
+# bm25 weights of the indexed columns, in table order.
+_WEIGHTS = {"title": 10.0, "summary": 4.0, "tags": 4.0, "body": 1.0}
+
+
+def _bigrams(run: str) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    return [run[index:index + 2] for index in range(len(run) - 1)]
+
+
+def tokenize(text: str) -> str:
+    """Rewrite CJK runs in ``text`` as space-separated overlapping bigrams.
+
+    FTS5's ``unicode61`` tokenizer splits on spaces and punctuation only, so a
+    Chinese sentence would otherwise be indexed as a single token. The last
+    character of a run is added on its own so that single-character queries,
+    which are prefix queries, find it too. Other scripts are left for the
+    tokenizer to handle.
+    """
+    def split(match):
+        run = match.group(0)
+        tokens = _bigrams(run) + ([run[-1]] if len(run) > 1 else [])
+        return " " + " ".join(tokens) + " "
+
+    return _CJK_RUN.sub(split, text or "")
+
+
+def match_expression(query: str) -> str:
+    """FTS5 MATCH expression requiring every term of a free-text ``query``.
+
+    A CJK term becomes a phrase of its bigrams, i.e. a substring match; a
+    trailing ``*`` makes a term a prefix query.
+    """
+    phrases = []
+    for term in _QUERY_TERM.findall(query):
+        prefix = term.endswith("*")
+        term = term.rstrip("*")
+        parts = []
+        for piece in filter(None, re.split(f"({_CJK_RUN.pattern})", term)):
+            if _CJK_RUN.fullmatch(piece):
+                bigrams = _bigrams(piece)
+                # A single character only ever appears inside a bigram.
+                parts.append(f'"{bigrams[0]}"*' if len(piece) == 1 else f'"{" ".join(bigrams)}"')
+            else:
+                parts.append(f'"{piece}"')
+        if prefix and parts and not parts[-1].endswith("*"):
+            parts[-1] += "*"
+        phrases.extend(parts)
+    return " AND ".join(phrases)
+
+
+class SearchIndex:
+    """SQLite FTS5 full-text index over clipped pages.
+
+    Each page is indexed by title, ``summary``, tags and its extracted block
+    text, with CJK text split into bigrams (see ``tokenize``). The original
+    fields live in a plain table next to the FTS table, so a page can be
+    updated one field at a time: property writes go through ``index_page``
+    and content fetches through ``set_body``. ``search`` returns page ids
+    ranked by bm25, with title matches weighted highest.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id INTEGER PRIMARY KEY,"
+            " page_id TEXT NOT NULL UNIQUE,"
+            " title TEXT NOT NULL DEFAULT '',"
+            " summary TEXT NOT NULL DEFAULT '',"
+            " tags TEXT NOT NULL DEFAULT '',"
+            " body TEXT NOT NULL DEFAULT '')"
+        )
+        self._conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS clips USING fts5("
+            f"{', '.join(_WEIGHTS)}, tokenize='unicode61')"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " database TEXT PRIMARY KEY,"
+            " last_edited_time TEXT NOT NULL)"
+        )
+
+    def index_page(self, page: dict) -> None:
+        """Index the title, summary and tags of a Notion page object, keeping its body."""
+        if not page.get("id") or "properties" not in page:
+            return
+        if page_removed(page):
+            self.remove(page["id"])
+            return
+        columns = page_columns(page)
+        self._update(page["id"], title=columns["name"], summary=columns["summary"],
+                     tags=columns["tags"])
+
+    def set_body(self, page_id: str, text: str) -> None:
+        self._update(page_id, body=text)
+
+    def _update(self, page_id: str, **fields: str) -> None:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT id, {', '.join(_WEIGHTS)} FROM documents WHERE page_id = ?", (page_id,)
+            ).fetchone()
+            current = dict(zip(_WEIGHTS, row[1:])) if row else dict.fromkeys(_WEIGHTS, "")
+            fields = {name: value or "" for name, value in fields.items()}
+            if row and all(current[name] == value for name, value in fields.items()):
+                return
+            current.update(fields)
+            values = [current[name] for name in _WEIGHTS]
+            self._conn.execute("BEGIN")
+            if row:
+                self._conn.execute(
+                    f"UPDATE documents SET {', '.join(f'{name} = ?' for name in _WEIGHTS)}"
+                    " WHERE id = ?", (*values, row[0]),
+                )
+                self._conn.execute("DELETE FROM clips WHERE rowid = ?", (row[0],))
+                rowid = row[0]
+            else:
+                rowid = self._conn.execute(
+                    f"INSERT INTO documents (page_id, {', '.join(_WEIGHTS)}) VALUES (?, ?, ?, ?, ?)",
+                    (page_id, *values),
+                ).lastrowid
+            self._conn.execute(
+                f"INSERT INTO clips (rowid, {', '.join(_WEIGHTS)}) VALUES (?, ?, ?, ?, ?)",
+                (rowid, *(tokenize(value) for value in values)),
+            )
+            self._conn.execute("COMMIT")
+
+    def remove(self, page_id: str) -> None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM documents WHERE page_id = ?", (page_id,)
+            ).fetchone()
+            if row is None:
+                return
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM clips WHERE rowid = ?", row)
+            self._conn.execute("DELETE FROM documents WHERE id = ?", row)
+            self._conn.execute("COMMIT")
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[str, str, float]]:
+        """``(page_id, title, score)`` of the best matches, best first; lower scores rank higher."""
+        expression = match_expression(query)
+        if not expression:
+            return []
+        weights = ", ".join(str(weight) for weight in _WEIGHTS.values())
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT documents.page_id, documents.title, bm25(clips, {weights}) AS score"
+                " FROM clips JOIN documents ON documents.id = clips.rowid"
+                " WHERE clips MATCH ? ORDER BY score LIMIT ?",
+                (expression, limit),
+            ).fetchall()
+
+    def watermark(self, database: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_edited_time FROM watermarks WHERE database = ?", (database,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, database: str, last_edited_time: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO watermarks (database, last_edited_time) VALUES (?, ?)"
+                " ON CONFLICT (database) DO UPDATE SET last_edited_time = excluded.last_edited_time",
+                (database, last_edited_time),
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,168 @@
+import json
+import re
+from typing import Any, Iterator, List, Tuple
+
+_FENCE_RE = re.compile(r"```[A-Za-z0-9_-]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+_NUMBER_RE = re.compile(r"-?[0-9][0-9.eE+-]*")
+_WORD_RE = re.compile(r"[\w$]+")
+_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f",
+            "n": "\n", "r": "\r", "t": "\t"}
+_LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true",
+             "False": "false", "None": "null", "undefined": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+_MISSING = object()
+
+
+def parse_structured(text: str, prefer: type = dict) -> Any:
+    """Parse the JSON object or array in an LLM reply, tolerating common defects.
+
+    Accepts code fences and prose around the value, single-quoted strings,
+    unquoted keys, Python/JS literals, ``//`` comments, trailing commas and raw
+    newlines inside strings. Output cut off mid-value (e.g. by a token limit)
+    is closed at the last complete member. A reply may hold several bracketed
+    values, such as a citation ``[1]`` before the answer or a second code block
+    after it: code blocks are searched first, then the whole text, each from
+    left to right, and the first value of type ``prefer`` wins over any other.
+    Raises ``ValueError`` if no value can be recovered.
+    """
+    fallback = _MISSING
+    texts = [match.group(1) for match in _FENCE_RE.finditer(text)] + [text]
+    for candidate in texts:
+        for value in _values(candidate, tolerant=True):
+            if isinstance(value, prefer):
+                return value
+            if fallback is _MISSING:
+                fallback = value
+    if fallback is _MISSING:
+        raise ValueError(f"no JSON object or array found: {text[:200]}")
+    return fallback
+
+
+def complete_value(text: str, prefer: type = dict) -> bool:
+    """Whether ``text`` already holds a whole, well-formed JSON value of type ``prefer``."""
+    return any(isinstance(value, prefer) for value in _values(text, tolerant=False))
+
+
+def _values(text: str, tolerant: bool) -> Iterator[Any]:
+    """Top-level JSON values in ``text``, left to right.
+
+    With ``tolerant`` a value that is not valid JSON is repaired as far as
+    possible; otherwise only well-formed values are returned.
+    """
+    decoder = json.JSONDecoder()
+    index = 0
+    while True:
+        starts = [start for start in (text.find("{", index), text.find("[", index)) if start >= 0]
+        if not starts:
+            return
+        start = min(starts)
+        try:
+            value, index = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            value, index = _repair(text, start) if tolerant else (_MISSING, start + 1)
+        if value is not _MISSING:
+            yield value
+
+
+def _repair(text: str, start: int) -> Tuple[Any, int]:
+    """The value starting at ``start`` and the index after it, or ``_MISSING``."""
+    tokens, end, complete = _tokenize(text, start)
+    if complete:
+        try:
+            return json.loads("".join(tokens)), end
+        except json.JSONDecodeError:
+            return _MISSING, start + 1
+    # Truncated: drop trailing tokens until what is left can be closed.
+    for cut in range(len(tokens), 0, -1):
+        try:
+            return json.loads(_close(tokens[:cut])), end
+        except json.JSONDecodeError:
+            continue
+    return _MISSING, start + 1
+
+
+def _tokenize(text: str, start: int) -> Tuple[List[str], int, bool]:
+    """Rewrite ``text[start:]`` as valid JSON tokens; also report where and if the value closed."""
+    tokens: List[str] = []
+    depth = 0
+    index = start
+    length = len(text)
+    while index < length:
+        char = text[index]
+        if char in "\"'":
+            token, index, closed = _read_string(text, index)
+            tokens.append(token)
+            if not closed:
+                return tokens, index, False
+        elif char in "{[":
+            tokens.append(char)
+            depth += 1
+            index += 1
+        elif char in "}]":
+            if tokens and tokens[-1] == ",":
+                tokens.pop()
+            tokens.append(char)
+            depth -= 1
+            index += 1
+            if depth == 0:
+                return tokens, index, True
+        elif char in ",:":
+            tokens.append(char)
+            index += 1
+        elif text.startswith("//", index):
+            newline = text.find("\n", index)
+            index = length if newline < 0 else newline + 1
+        elif char == "-" or char.isdigit():
+            match = _NUMBER_RE.match(text, index)
+            if match is None:
+                index += 1
+                continue
+            tokens.append(match.group(0))
+            index = match.end()
+        elif char.isalpha() or char in "_$":
+            match = _WORD_RE.match(text, index)
+            word = match.group(0)
+            index = match.end()
+            rest = text[index:].lstrip()
+            if rest.startswith(":") or word not in _LITERALS:
+                tokens.append(json.dumps(word, ensure_ascii=False))
+            else:
+                tokens.append(_LITERALS[word])
+        else:
+            index += 1
+    return tokens, index, False
+
+
+def _read_string(text: str, index: int) -> Tuple[str, int, bool]:
+    quote = text[index]
+    index += 1
+    chars = []
+    while index < len(text):
+        char = text[index]
+        if char == quote:
+            return json.dumps("".join(chars), ensure_ascii=False), index + 1, True
+        if char == "\\" and index + 1 < len(text):
+            escaped = text[index + 1]
+            if escaped == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", text[index + 2:index + 6]):
+                chars.append(chr(int(text[index + 2:index + 6], 16)))
+                index += 6
+                continue
+            chars.append(_ESCAPES.get(escaped, "\\" + escaped))
+            index += 2
+            continue
+        chars.append(char)
+        index += 1
+    return json.dumps("".join(chars), ensure_ascii=False), index, False
+
+
+def _close(tokens: List[str]) -> str:
+    tokens = list(tokens)
+    while tokens and tokens[-1] in (",", ":"):
+        tokens.pop()
+    stack = []
+    for token in tokens:
+        if token in _CLOSERS:
+            stack.append(token)
+        elif token in ("}", "]") and stack:
+            stack.pop()
+    return "".join(tokens) + "".join(_CLOSERS[opener] for opener in reversed(stack))
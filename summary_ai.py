@@ -1,9 +1,171 @@
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
 import ollama
 
+from glm_ai import estimate_tokens
+from llm_cache import LlmCache
+from metrics import Metrics
+
+# Bump whenever the chunk prompt changes so cached chunk summaries are not reused.
+CHUNK_PROMPT_VERSION = "1"
+CHUNK_PROMPT = '请用中文概括上面这部分文章的要点，保留关键事实、观点和结论，不要输出其他内容。'
+REDUCE_PREFIX = '以下是一篇长文章按顺序各部分的要点：'
+
+
+def chunk_lines(lines: List[str], token_budget: int) -> List[List[str]]:
+    """Group consecutive lines into chunks of at most ``token_budget`` estimated tokens.
+
+    Past half the budget a chunk also ends after any line whose checksum is
+    divisible by four. Those boundaries depend only on the content, so an edit
+    changes the chunks around it while later chunks come out the same and hit
+    the cache. Lines are only split when one exceeds the budget on its own.
+    """
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if cost > token_budget:
+            # Cut an oversized line into pieces of roughly the budget.
+            size = max(1, len(line) * token_budget // cost)
+            pieces = [line[start:start + size] for start in range(0, len(line), size)]
+        else:
+            pieces = [line]
+        for piece in pieces:
+            cost = estimate_tokens(piece) + 1
+            if current and used + cost > token_budget:
+                chunks.append(current)
+                current, used = [], 0
+            current.append(piece)
+            used += cost
+            if used >= token_budget // 2 and zlib.crc32(piece.encode('utf-8')) % 4 == 0:
+                chunks.append(current)
+                current, used = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
 class SummaryAi:
+    """Summaries from a local Ollama model.
+
+    Texts over ``chunk_tokens`` are summarized map-reduce style: split at line
+    (block) boundaries into chunks, each chunk summarized on up to ``workers``
+    threads, and the partial summaries answered in one final call with the
+    original prompt. Ollama only runs the chunks concurrently when the server
+    allows it (``OLLAMA_NUM_PARALLEL``). With a ``cache`` the chunk summaries
+    are stored by content, so an edited page only re-summarizes changed chunks.
+
+    Every request asks Ollama to keep the model loaded for ``keep_alive``, so
+    one instance reused across pages pays the model load once, in ``warm_up``.
 
-    def __init__(self, model='gemma2:27b'):
+    An instance is safe to share between threads. At most ``max_in_flight``
+    requests run at once, which should match the server's parallel slots
+    (``OLLAMA_NUM_PARALLEL``) so requests batch-decode instead of queueing
+    server-side. Output is streamed, and each request records its duration,
+    time to first token and decode tokens/sec in ``metrics``.
+    """
+
+    def __init__(self, model='gemma2:27b', cache: Optional[LlmCache] = None,
+                 chunk_tokens: int = 3000, workers: int = 4, keep_alive='30m',
+                 max_in_flight: int = 1, metrics: Optional[Metrics] = None):
         self.model = model
+        self.cache = cache
+        self.chunk_tokens = chunk_tokens
+        self.workers = max(1, workers)
+        self.keep_alive = keep_alive
+        self.metrics = metrics or Metrics()
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight))
+
+    def warm_up(self) -> float:
+        """Load the model into memory ahead of the first request; returns the seconds taken."""
+        started = time.monotonic()
+        # A request without a prompt only loads the model.
+        ollama.generate(model=self.model, prompt='', keep_alive=self.keep_alive)
+        return time.monotonic() - started
+
+    def release(self):
+        """Unload the model, e.g. before another model takes over the server."""
+        ollama.generate(model=self.model, prompt='', keep_alive=0)
+
+    def _generate(self, prompt):
+        parts = []
+        final = None
+        with self._slots:
+            started = time.perf_counter()
+            first_token = None
+            stream = ollama.generate(
+                model = self.model,
+                prompt = prompt,
+                options = {
+                    'seed': 0
+                },
+                keep_alive = self.keep_alive,
+                stream = True
+            )
+            for chunk in stream:
+                if chunk['response']:
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    parts.append(chunk['response'])
+                if chunk.get('done'):
+                    final = chunk
+            finished = time.perf_counter()
+        self._record(final, started, first_token, finished, len(parts))
+        return ''.join(parts)
+
+    def _record(self, final, started, first_token, finished, chunks):
+        self.metrics.observe('ollama_request_seconds', finished - started, model=self.model)
+        if first_token is not None:
+            self.metrics.observe('ollama_first_token_seconds', first_token - started,
+                                 model=self.model)
+        final = final or {}
+        tokens = final.get('eval_count') or chunks
+        self.metrics.inc('ollama_tokens_total', tokens, model=self.model, kind='completion')
+        if final.get('prompt_eval_count'):
+            self.metrics.inc('ollama_tokens_total', final['prompt_eval_count'],
+                             model=self.model, kind='prompt')
+        # Ollama reports decode time in nanoseconds; without it, time the stream.
+        if final.get('eval_duration'):
+            decode_seconds = final['eval_duration'] / 1e9
+        else:
+            decode_seconds = finished - (first_token or started)
+        if tokens and decode_seconds > 0:
+            self.metrics.observe('ollama_tokens_per_second', tokens / decode_seconds,
+                                 model=self.model)
+
+    def _condense(self, text):
+        """``text`` itself if it fits one prompt, else the joined summaries of its chunks."""
+        lines = text.split('\n')
+        tokens = estimate_tokens(text)
+        while tokens > self.chunk_tokens:
+            chunks = ['\n'.join(chunk) for chunk in chunk_lines(lines, self.chunk_tokens)]
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(chunks))) as executor:
+                partials = list(executor.map(self._summarize_chunk, chunks))
+            lines = [REDUCE_PREFIX] + [f'{index}. {partial.strip()}'
+                                       for index, partial in enumerate(partials, 1)]
+            condensed = '\n'.join(lines)
+            # Summaries of summaries normally shrink; stop rather than loop if not.
+            if estimate_tokens(condensed) >= tokens:
+                break
+            text, tokens = condensed, estimate_tokens(condensed)
+        return text
+
+    def _summarize_chunk(self, chunk):
+        key = None
+        if self.cache is not None:
+            key = LlmCache.make_key(self.model, CHUNK_PROMPT_VERSION, chunk)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        result = self._generate(chunk + '\n' + CHUNK_PROMPT)
+        if key is not None:
+            self.cache.set(key, result)
+        return result
     
     def summary2(self, text):
         # prompt = '''
@@ -21,37 +183,16 @@ class SummaryAi:
         请用中文帮我按照下面格式详细汇总上面文章的主旨和主要内容。
         字数限制：字数在500-100字之间
         '''
-        prompt = text + '\n' + prompt
-        response = ollama.generate(
-            model = self.model,
-            prompt = prompt,
-            options = {
-                'seed': 0
-            }
-        )
-        return response['response']
+        prompt = self._condense(text) + '\n' + prompt
+        return self._generate(prompt)
     
     def summary(self, text):
         prompt = '请帮我使用一短话简要汇总上面文章的主要内容，不需要分汇总，并给出文章的tags。结果输出为严格的json格式字符串，不需要增加json代码标识，自动对输出格式按照json标准校验，并修正输出格式，其中内容汇总的key为summary，tags的key为tags。输出结果的json字符串格式如下：{"summary": "xxx", "tags": ["xxx", "xxx"]}。summary和tags的值不能携带双引号，有需要自动转成单引号。直接输出最终结果即可，不要输出中间过程。'
-        prompt = text + '\n' + prompt
-        response = ollama.generate(
-            model = self.model,
-            prompt = prompt,
-            options = {
-                'seed': 0
-            }
-        )
-        return response['response']
+        prompt = self._condense(text) + '\n' + prompt
+        return self._generate(prompt)
         
     def classify(self, text):
         prompt = '如果可能，请帮我选择一个最合适的分类，并输出分类的名称，如果无法判断合适的分类，请输出分类为其他。输出的结果为简单的分类名称，不要输出其他任何信息。'
         prompt = text + '\n' + prompt
-        response = ollama.generate(
-            model = self.model,
-            prompt = prompt,
-            options = {
-                'seed': 0
-            }
-        )
-        return response['response']
+        return self._generate(prompt)
         
\ No newline at end of file
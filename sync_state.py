@@ -0,0 +1,118 @@
+import hashlib
+import sqlite3
+import threading
+from typing import Optional
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def incremental_query(watermark: Optional[str]) -> dict:
+    """Database query for pages edited at or after ``watermark``, oldest first."""
+    query = {
+        "sorts": [
+            {
+                "timestamp": "last_edited_time",
+                "direction": "ascending"
+            }
+        ]
+    }
+    if watermark:
+        query["filter"] = {
+            "timestamp": "last_edited_time",
+            "last_edited_time": {
+                "on_or_after": watermark
+            }
+        }
+    return query
+
+
+class SyncState:
+    """Local state for incremental syncs, stored in SQLite.
+
+    Keeps a ``last_edited_time`` high-water mark per sync scope plus the hash
+    of the content each page had when it was last processed, so pages that
+    were only touched (e.g. by our own PATCH) can be told apart from pages
+    whose content really changed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS watermarks ("
+            " scope TEXT PRIMARY KEY,"
+            " last_edited_time TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS content_hashes ("
+            " scope TEXT NOT NULL,"
+            " page_id TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " PRIMARY KEY (scope, page_id))"
+        )
+
+    def watermark(self, scope: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_edited_time FROM watermarks WHERE scope = ?", (scope,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, scope: str, last_edited_time: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO watermarks (scope, last_edited_time) VALUES (?, ?)"
+                " ON CONFLICT (scope) DO UPDATE SET last_edited_time = excluded.last_edited_time",
+                (scope, last_edited_time),
+            )
+
+    def content_hash(self, scope: str, page_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hash FROM content_hashes WHERE scope = ? AND page_id = ?",
+                (scope, page_id),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_content_hash(self, scope: str, page_id: str, digest: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO content_hashes (scope, page_id, hash) VALUES (?, ?, ?)"
+                " ON CONFLICT (scope, page_id) DO UPDATE SET hash = excluded.hash",
+                (scope, page_id, digest),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class WatermarkTracker:
+    """Computes the next high-water mark of a sync run.
+
+    The mark advances to the newest ``last_edited_time`` seen, but never past
+    a page that failed, so failed pages are picked up again by the next run.
+    """
+
+    def __init__(self, start: Optional[str]) -> None:
+        self._lock = threading.Lock()
+        self._newest = start
+        self._oldest_failure: Optional[str] = None
+
+    def seen(self, last_edited_time: Optional[str], ok: bool) -> None:
+        if not last_edited_time:
+            return
+        with self._lock:
+            if self._newest is None or last_edited_time > self._newest:
+                self._newest = last_edited_time
+            if not ok and (self._oldest_failure is None
+                           or last_edited_time < self._oldest_failure):
+                self._oldest_failure = last_edited_time
+
+    @property
+    def value(self) -> Optional[str]:
+        return self._oldest_failure or self._newest
@@ -0,0 +1,26 @@
+import pytest
+
+from benchmarks.fake_services import FakeGlm, FakeGlmBatch, FakeNotion
+
+
+@pytest.fixture
+def notion(monkeypatch):
+    with FakeNotion(pages=5, blocks_per_page=2) as server:
+        monkeypatch.setenv("NOTION_TOKEN", "test-token")
+        monkeypatch.setenv("NOTION_API_BASE", f"{server.url}/v1")
+        yield server
+
+
+@pytest.fixture
+def glm(monkeypatch):
+    with FakeGlm() as server:
+        monkeypatch.setenv("GLM_API_KEY", "test-key")
+        monkeypatch.setenv("GLM_BASE_URL", server.chat_url)
+        yield server
+
+
+@pytest.fixture
+def glm_batch(monkeypatch):
+    with FakeGlmBatch(failures=1) as server:
+        monkeypatch.setenv("GLM_BATCH_BASE_URL", server.base_url)
+        yield server
@@ -0,0 +1,20 @@
+from checkpoint import CheckpointJournal
+
+
+def test_record_after_torn_last_line_reads_back(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = CheckpointJournal(str(path), resume=False)
+    journal.record("a", "written")
+    journal.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"page_id": "b", "sta')
+
+    journal = CheckpointJournal(str(path))
+    assert journal.state("b") is None
+    journal.record("c", "written")
+    journal.close()
+
+    journal = CheckpointJournal(str(path))
+    assert journal.reached("a", "written")
+    assert journal.reached("c", "written")
+    journal.close()
@@ -0,0 +1,17 @@
+import argparse
+
+from cliper import Cliper
+from run_cliper import run_batch
+
+
+def test_batch_round_trip_writes_answered_pages(notion, glm, glm_batch, tmp_path, capsys):
+    cliper = Cliper(env_file=None)
+    args = argparse.Namespace(batch_id=None, batch_file=str(tmp_path / "requests.jsonl"),
+                              start_cursor=None, batch_poll_interval=0)
+
+    assert run_batch(cliper, notion.query_url, args) == 0
+
+    updated = [page for page in notion.pages.values() if page["properties"]["updated"]["checkbox"]]
+    assert len(updated) == 4
+    assert all(page["properties"]["Classfiy"]["select"]["name"] for page in updated)
+    assert "已应用 4 条批处理结果" in capsys.readouterr().out
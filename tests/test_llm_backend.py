@@ -0,0 +1,81 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from glm_ai import GlmAi
+from llm_backend import FailoverBackend, LlmAnswerError
+from llm_cache import LlmCache
+
+ANSWER = '{"summary": "摘要", "tags": ["标签"], "category": "学习"}'
+
+
+class Provider:
+    def __init__(self, model, answer=None, error=None, latency=0.0):
+        self.model = model
+        self.latency = latency
+        self.answer = answer
+        self.error = error
+
+    def chat(self, messages, stop=None):
+        time.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return self.answer
+
+
+def make_backend(*providers, **options):
+    options.setdefault("initial_hedge_after", 60)
+    return FailoverBackend({provider.model: provider for provider in providers}, **options)
+
+
+def test_refused_or_unusable_answers_skip_the_page_even_with_a_provider_down():
+    backend = make_backend(
+        Provider("filtered", error=ValueError("内容被过滤，无法处理")),
+        Provider("down", error=RuntimeError("GLM 接口请求失败: timed out")),
+        Provider("garbage", answer="抱歉，我无法回答。"),
+    )
+    ai = GlmAi(env_file=None, backend=backend)
+    with pytest.raises(LlmAnswerError):
+        ai.analyze("正文")
+    backend.close()
+
+
+def test_unreachable_providers_still_stop_the_run():
+    backend = make_backend(
+        Provider("down", error=RuntimeError("GLM 接口请求失败: timed out")),
+        Provider("also-down", error=RuntimeError("GLM 接口请求失败 503")),
+    )
+    with pytest.raises(RuntimeError) as info:
+        GlmAi(env_file=None, backend=backend).analyze("正文")
+    assert not isinstance(info.value, ValueError)
+    backend.close()
+
+
+def test_answers_are_cached_under_the_model_that_wrote_them(tmp_path):
+    cache = LlmCache(str(tmp_path / "cache.sqlite3"))
+    backend = make_backend(
+        Provider("primary", error=RuntimeError("GLM 接口请求失败 503")),
+        Provider("secondary", answer=ANSWER),
+    )
+    ai = GlmAi(env_file=None, backend=backend, cache=cache, model="primary")
+    result = ai.analyze("正文")
+
+    assert cache.get(LlmCache.make_key("secondary", GlmAi.PROMPT_VERSION, "analyze", "正文", [])) == result
+    assert cache.get(LlmCache.make_key("primary", GlmAi.PROMPT_VERSION, "analyze", "正文", [])) is None
+    backend.providers["secondary"].answer = None
+    assert ai.analyze("正文") == result
+    backend.close()
+    cache.close()
+
+
+def test_attempts_queued_for_a_thread_are_not_hedged():
+    backend = make_backend(Provider("primary", answer=ANSWER, latency=0.2),
+                           Provider("secondary", answer=ANSWER, latency=0.2),
+                           initial_hedge_after=0.3, concurrency=1)
+    with ThreadPoolExecutor(max_workers=6) as callers:
+        answers = list(callers.map(lambda _: backend([], "json"), range(6)))
+
+    assert answers == [(ANSWER, "primary")] * 6
+    assert backend.metrics.counter("llm_hedges_total") == 0
+    backend.close()
@@ -0,0 +1,15 @@
+from metrics import Metrics
+
+
+def test_summary_prints_seconds_only_for_latency_histograms():
+    metrics = Metrics()
+    metrics.observe("ollama_request_seconds", 1.5)
+    metrics.observe("ollama_tokens_per_second", 42.0)
+
+    lines = metrics.summary().splitlines()
+
+    latency = next(line for line in lines if "ollama_request_seconds" in line)
+    rate = next(line for line in lines if "ollama_tokens_per_second" in line)
+    assert "max=1.500s" in latency
+    assert "max=42.000" in rate and not rate.endswith("s")
+    assert "p50=42.000 " in rate
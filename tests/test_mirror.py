@@ -0,0 +1,32 @@
+from cliper import Cliper
+from mirror import NotionMirror
+
+
+def test_cliper_drops_pages_deleted_from_notion(notion, glm, tmp_path):
+    cliper = Cliper(env_file=None, mirror=NotionMirror(str(tmp_path / "mirror.sqlite3")))
+    cliper.mirror.sync(notion.query_url, lambda body: cliper._request_json(notion.query_url, body))
+    deleted = next(iter(notion.pages))
+    del notion.pages[deleted]
+
+    cliper.update_web_clips(notion.query_url)
+
+    assert cliper.mirror.count(notion.query_url) == 4
+    assert cliper.metrics.counter("pages_total", result="deleted") == 1
+    assert all(page["properties"]["updated"]["checkbox"] for page in notion.pages.values())
+    cliper.mirror.close()
+
+
+
+def test_sync_drops_pages_moved_to_trash(tmp_path):
+    mirror = NotionMirror(str(tmp_path / "mirror.sqlite3"))
+    pages = [{"id": page_id, "last_edited_time": f"2024-01-0{index}T00:00:00.000Z", "properties": {}}
+             for index, page_id in enumerate(("a", "b"), 1)]
+
+    def fetch(results):
+        return lambda body: {"results": results, "has_more": False, "next_cursor": None}
+
+    mirror.sync("db", fetch(pages))
+    mirror.sync("db", fetch([dict(pages[0], in_trash=True, last_edited_time="2024-01-03T00:00:00.000Z")]))
+
+    assert [page["id"] for page in mirror.query("db")] == ["b"]
+    mirror.close()
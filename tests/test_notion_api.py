@@ -0,0 +1,34 @@
+from notion_api import iter_block_text
+
+
+def paragraph(block_id, text, has_children=False):
+    return {
+        "id": block_id,
+        "type": "paragraph",
+        "has_children": has_children,
+        "paragraph": {"rich_text": [{"plain_text": text}]},
+    }
+
+
+def test_block_text_stops_when_has_more_comes_without_a_cursor():
+    calls = []
+
+    def fetch(block_id, cursor):
+        calls.append((block_id, cursor))
+        return {"results": [paragraph("a", "only page")], "has_more": True, "next_cursor": None}
+
+    assert list(iter_block_text(fetch, "root")) == ["only page"]
+    assert calls == [("root", None)]
+
+
+def test_block_text_follows_cursors_into_nested_blocks():
+    pages = {
+        ("root", None): {"results": [paragraph("a", "one", has_children=True)],
+                         "has_more": True, "next_cursor": "c1"},
+        ("root", "c1"): {"results": [paragraph("b", "three")], "has_more": False},
+        ("a", None): {"results": [paragraph("a1", "two")], "has_more": False},
+    }
+
+    assert list(iter_block_text(lambda block_id, cursor: pages[block_id, cursor], "root")) == [
+        "one", "two", "three",
+    ]
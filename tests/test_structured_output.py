@@ -0,0 +1,60 @@
+import pytest
+
+from structured_output import parse_structured
+
+
+def test_fenced_output():
+    assert parse_structured('好的：\n```json\n{"summary": "摘要", "tags": ["a"]}\n```') == {
+        "summary": "摘要", "tags": ["a"],
+    }
+
+
+def test_single_quotes():
+    assert parse_structured("{'summary': 'it\\'s', 'tags': ['a']}") == {
+        "summary": "it's", "tags": ["a"],
+    }
+
+
+def test_trailing_commas():
+    assert parse_structured('{"tags": ["a", "b",], "summary": "s",}') == {
+        "tags": ["a", "b"], "summary": "s",
+    }
+
+
+def test_unquoted_keys_and_literals():
+    assert parse_structured("{summary: 's', done: True, note: None}") == {
+        "summary": "s", "done": True, "note": None,
+    }
+
+
+def test_truncated_object():
+    assert parse_structured('{"summary": "完整的摘要", "tags": ["a", "b') == {
+        "summary": "完整的摘要", "tags": ["a", "b"],
+    }
+
+
+def test_truncated_array():
+    assert parse_structured('[{"id": 1, "category": "学习"}, {"id": 2, "categ', list) == [
+        {"id": 1, "category": "学习"}, {"id": 2},
+    ]
+
+
+def test_prefers_object_over_earlier_bracketed_text():
+    assert parse_structured('The answer [1] is {"summary": "s"}') == {"summary": "s"}
+
+
+def test_prefers_object_over_later_code_block():
+    assert parse_structured('{"summary": "s"}\n```extra [1]```') == {"summary": "s"}
+
+
+def test_prefers_array_when_asked():
+    assert parse_structured('说明 {"note": 1}\n[{"id": 1}]', list) == [{"id": 1}]
+
+
+def test_falls_back_to_another_type():
+    assert parse_structured("[1, 2]") == [1, 2]
+
+
+def test_no_value():
+    with pytest.raises(ValueError):
+        parse_structured("没有 JSON")
@@ -1,16 +1,38 @@
 import os
+import queue
 import custom_requests as requests
 import json
 import time
 import re
-import execjs
+import threading
+from typing import Optional
 from dotenv import load_dotenv
+from content_cache import ContentCache
+from llm_cache import LlmCache
+from metrics import Metrics
+from mirror import NotionMirror, page_removed
+from search_index import SearchIndex
+from notion_api import (
+    NOTION_MAX_PAGE_SIZE, iter_block_text, iter_query_pages, notion_base_url, notion_retry_policy,
+    page_gone,
+)
+from structured_output import parse_structured
 from summary_ai import SummaryAi
+from sync_state import SyncState, WatermarkTracker, content_hash, incremental_query
+
+SUMMARY_MODEL = 'qwen2.5'
+CLASSIFY_MODEL = 'llama3.1'
 
 
 class WebCliper:
 
-    def __init__(self, env_file: str = ".env"):
+    def __init__(self, env_file: str = ".env", block_concurrency: int = 8,
+                 content_cache: Optional[ContentCache] = None,
+                 mirror: Optional[NotionMirror] = None,
+                 search_index: Optional[SearchIndex] = None,
+                 summary_cache: Optional[LlmCache] = None,
+                 workers: int = 1, ollama_parallel: Optional[int] = None,
+                 metrics: Optional[Metrics] = None):
         if env_file:
             load_dotenv(env_file)
         else:
@@ -23,6 +45,121 @@ class WebCliper:
             "Notion-Version": "2022-02-22",
             "Content-Type": "application/json",
         }
+        self.notion_url = notion_base_url()
+        # Nested blocks of a page are fetched on this many threads.
+        self.block_concurrency = block_concurrency
+        # Extracted page text by page id and last_edited_time, so unchanged
+        # pages are re-summarized without fetching their blocks again.
+        self.content_cache = content_cache
+        # Local copy of the database that selects pages without paging through the API.
+        self.mirror = mirror
+        # Full-text index fed with the page text and properties this class sees.
+        self.search_index = search_index
+        # Chunk summaries of long articles, so edits only re-summarize changed chunks.
+        self.summary_cache = summary_cache
+        # One SummaryAi per Ollama model for the whole run; only the model in use
+        # is kept loaded, so runs should finish one model's work before the next.
+        self._summary_ais = {}
+        self._active_model = None
+        self._model_lock = threading.Lock()
+        # Pages are processed on this many threads, fed from a bounded queue;
+        # ollama_parallel caps concurrent Ollama requests (default: workers).
+        self.workers = max(1, workers)
+        self.ollama_parallel = ollama_parallel or self.workers
+        self.metrics = metrics or Metrics()
+        self.session = requests.Session(headers=self.headers, retry=notion_retry_policy(),
+                                        on_request=self.metrics.observe_http)
+
+    def summary_ai(self, model):
+        """The run's ``SummaryAi`` for ``model``, loaded on first use.
+
+        Switching to another model unloads the previous one, so both never
+        compete for memory and each load is paid once per group of pages.
+        """
+        with self._model_lock:
+            ai = self._summary_ais.get(model)
+            if ai is None:
+                ai = SummaryAi(model, cache=self.summary_cache,
+                               max_in_flight=self.ollama_parallel, metrics=self.metrics)
+                self._summary_ais[model] = ai
+            if self._active_model != model:
+                if self._active_model is not None:
+                    self._summary_ais[self._active_model].release()
+                print('加载模型 ' + model)
+                print('模型 ' + model + ' 已加载，耗时 %.1f 秒' % ai.warm_up())
+                self._active_model = model
+        return ai
+
+    def run_pages(self, func, pages):
+        """Call ``func`` on every page, on ``workers`` threads fed from a bounded queue.
+
+        The queue keeps the page query only a little ahead of the workers, so
+        Ollama always has the next requests waiting while memory stays flat.
+        The first exception stops the feed and is raised once the workers exit;
+        pages deleted from Notion meanwhile are skipped instead.
+        """
+        if self.workers == 1:
+            for page in pages:
+                self.run_page(func, page)
+            return
+
+        tasks = queue.Queue(maxsize=self.workers * 2)
+        errors = []
+
+        def work():
+            while True:
+                page = tasks.get()
+                if page is None:
+                    return
+                if errors:
+                    continue
+                try:
+                    self.run_page(func, page)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for page in pages:
+                if errors:
+                    break
+                tasks.put(page)
+        finally:
+            for _ in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+    def run_page(self, func, page):
+        try:
+            func(page)
+        except requests.HTTPError as e:
+            if not page_gone(e):
+                raise
+            self.forget_page(page['id'])
+            print(page['id'] + ' 已在 Notion 中删除，跳过')
+
+    def forget_page(self, id):
+        """Drop a page deleted from Notion from the mirror and the search index."""
+        if self.mirror is not None:
+            self.mirror.remove(id)
+        if self.search_index is not None:
+            self.search_index.remove(id)
+
+    def query_pages(self, url, params=None, next_cursor=None):
+        def fetch(body):
+            response = self.session.post(url, headers=self.headers, data=json.dumps(body))
+            return response.json()
+
+        condition = (params or {}).get('filter')
+        if self.mirror is not None and not next_cursor and self.mirror.supports(condition):
+            self.mirror.sync(url, fetch)
+            return iter(self.mirror.query(url, condition))
+        return iter_query_pages(fetch, params, next_cursor)
 
     def edit_articles_by_classify(self, url, classify, next_cursor=None):
         params = {
@@ -33,19 +170,12 @@ class WebCliper:
                 }
             },
         }
-        if next_cursor:
-            params['start_cursor'] = next_cursor
-        response = requests.post(url, headers=self.headers, data=json.dumps(params))
-        res = response.json()
-
-        for page in res['results']:
+        def summarize(page):
             print('summarying ' + page['properties']['Name']['title'][0]['plain_text'] + '  ' +  page['id'])
-            self.only_summary_content(page['id'])
+            self.only_summary_content(page['id'], page.get('last_edited_time'))
             print('汇总 ' + page['properties']['Name']['title'][0]['plain_text'] + ' 完成')
-        
-        if res['has_more']:
-            self.edit_articles_by_classify(url, classify, res['next_cursor'])
-        
+
+        self.run_pages(summarize, self.query_pages(url, params, next_cursor))
         print('all done')
 
     def edit_articles(self, url, next_cursor=None):
@@ -57,70 +187,129 @@ class WebCliper:
                 }
             },
         }
-        if next_cursor:
-            params['start_cursor'] = next_cursor
-        response = requests.post(url, headers=self.headers, data=json.dumps(params))
-        res = response.json()
-
-        for page in res['results']:
+        def summarize(page):
             if page['properties']['marked']['checkbox']:
                 print(page['properties']['Name']['title'][0]['plain_text'] + '  ' +  page['id'] + ' 已标记过，跳过')
-                continue
+                return
             print('summarying ' + page['properties']['Name']['title'][0]['plain_text'] + '  ' +  page['id'])
-            self.summary_content(page['id'])
+            self.summary_content(page['id'], last_edited_time=page.get('last_edited_time'))
             print('汇总 ' + page['properties']['Name']['title'][0]['plain_text'] + ' 完成')
-        
-        if res['has_more']:
-            self.edit_articles(url, res['next_cursor'])
-        
+
+        self.run_pages(summarize, self.query_pages(url, params, next_cursor))
+        print('all done')
+
+    def sync_articles(self, url, state: SyncState):
+        """Incremental ``edit_articles``: summarize pages edited since the last sync.
+
+        Only pages whose article text hash differs from the last summarized
+        version are summarized again, whether or not they are ``marked``.
+        """
+        scope = 'webcliper:' + url
+        tracker = WatermarkTracker(state.watermark(scope))
+
+        def sync(page):
+            name = page['properties']['Name']['title'][0]['plain_text']
+            blocks = self.get_page_content(page['id'], page.get('last_edited_time'))
+            digest = content_hash('\n'.join(blocks))
+            known = state.content_hash(scope, page['id'])
+            ok = True
+            if known == digest:
+                print(name + '  ' + page['id'] + ' 内容未变化，跳过')
+            elif known is None and page['properties']['marked']['checkbox']:
+                # Summarized before incremental sync was used: take it as the baseline.
+                state.set_content_hash(scope, page['id'], digest)
+            else:
+                print('summarying ' + name + '  ' + page['id'])
+                ok = self.summary_content(page['id'], blocks, page.get('last_edited_time'))
+                if ok:
+                    state.set_content_hash(scope, page['id'], digest)
+                    print('汇总 ' + name + ' 完成')
+            tracker.seen(page.get('last_edited_time'), ok)
+
+        self.run_pages(sync, self.query_pages(url, incremental_query(tracker.value)))
+        if tracker.value:
+            state.set_watermark(scope, tracker.value)
         print('all done')
 
+    def index_articles(self, url) -> int:
+        """Add pages edited since the last indexing run to ``search_index``."""
+        tracker = WatermarkTracker(self.search_index.watermark(url))
+        count = 0
+        for page in self.query_pages(url, incremental_query(tracker.value)):
+            try:
+                self.search_index.index_page(page)
+                if not page_removed(page):
+                    self.get_page_content(page['id'], page.get('last_edited_time'))
+            except Exception as e:
+                print(page['id'] + ' 索引失败: ' + str(e))
+                tracker.seen(page.get('last_edited_time'), False)
+                continue
+            tracker.seen(page.get('last_edited_time'), True)
+            count += 1
+
+        if tracker.value:
+            self.search_index.set_watermark(url, tracker.value)
+        return count
+
+    def edit_all(self, url):
+        """Summarize unmarked articles, then classify unclassified ones.
+
+        Each model runs over all its pages before the next one is loaded.
+        """
+        self.edit_articles(url)
+        self.edit_articles_classify(url)
+
     def edit_database(self, url):
-        pages = self.edit_articles(url)
-        for page in pages:
+        def summarize(page):
             print('summarying ' + page['properties']['Name']['title'][0]['plain_text'])
-            self.summary_content(page['id'])
+            self.summary_content(page['id'], last_edited_time=page.get('last_edited_time'))
             print('汇总 ' + page['properties']['Name']['title'][0]['plain_text'] + ' 完成')
 
-    def get_page_content(self, url, next_cursor=None, blocks=[]):
-        params = {
-            'page_size': 100
-        }
-        if next_cursor:
+        self.run_pages(summarize, self.query_pages(url))
+
+    def get_page_content(self, id, last_edited_time=None):
+        if self.content_cache is None or not last_edited_time:
+            blocks = list(self.iter_page_text(id))
+        else:
+            blocks = self.content_cache.get(id, last_edited_time)
+            if blocks is None:
+                blocks = list(self.iter_page_text(id))
+                self.content_cache.set(id, last_edited_time, blocks)
+        if self.search_index is not None:
+            self.search_index.set_body(id, '\n'.join(blocks))
+        return blocks
+
+    def iter_page_text(self, id):
+        """Stream the text of every block of a page, nested ones included, in document order."""
+        def fetch(block_id, next_cursor):
             params = {
-                'start_cursor': next_cursor
+                'page_size': NOTION_MAX_PAGE_SIZE
             }
-        response = requests.get(url, headers=self.headers, params=params)
-        res = response.json()
-        results = res['results']
-        
-        for block in results:
-            if 'paragraph' in block and len(block['paragraph']['rich_text']) > 0:
-                blocks.append(block['paragraph']['rich_text'][0]['plain_text'])
-
-        if res['has_more']:
-            self.get_page_content(url, res['next_cursor'], blocks)
+            if next_cursor:
+                params['start_cursor'] = next_cursor
+            url = self.notion_url + "/blocks/" + block_id + "/children"
+            response = self.session.get(url, headers=self.headers, params=params)
+            return response.json()
 
-        return blocks
+        return iter_block_text(fetch, id, self.block_concurrency)
     
-    def only_summary_content(self, id):
-        ai = SummaryAi('qwen2.5')
-        url = "https://api.notion.com/v1/blocks/" + id + "/children"
-        blocks = self.get_page_content(url, next_cursor=None, blocks=[])
+    def only_summary_content(self, id, last_edited_time=None):
+        ai = self.summary_ai(SUMMARY_MODEL)
+        blocks = self.get_page_content(id, last_edited_time)
         
         if len(blocks) == 0:
             return
 
-        text = ''.join(blocks)
+        text = '\n'.join(blocks)
         result = ai.summary2(text)
 
         try:
-            self.edit_summary(id, result)
+            self.edit_summary(id, result, last_edited_time)
         except Exception as e:
             print(e)
             print(result)
 
-    def edit_summary(self, id, playload):
+    def edit_summary(self, id, playload, last_edited_time=None):
         data = {
             "properties": {
                 "marked": {
@@ -150,29 +339,28 @@ class WebCliper:
                 }
             }
         }
-        url = "https://api.notion.com/v1/pages/" + id
-        response = requests.patch(url, headers=self.headers, data=json.dumps(data))
-        return response.text
+        return self.patch_page(id, data, last_edited_time)
 
-    def summary_content(self, id):
-        ai = SummaryAi('qwen2.5')
-        url = "https://api.notion.com/v1/blocks/" + id + "/children"
-        blocks = self.get_page_content(url, next_cursor=None, blocks=[])
+    def summary_content(self, id, blocks=None, last_edited_time=None):
+        ai = self.summary_ai(SUMMARY_MODEL)
+        if blocks is None:
+            blocks = self.get_page_content(id, last_edited_time)
         
         if len(blocks) == 0:
-            return
+            return True
 
-        text = ''.join(blocks)
+        text = '\n'.join(blocks)
         result = ai.summary(text)
-        result = re.sub(r'^```json|`+$', '', result)
 
         try:
-            self.edit_page(id, execjs.eval(result))
+            self.edit_page(id, parse_structured(result), last_edited_time)
         except Exception as e:
             print(e)
             print(result)
+            return False
+        return True
 
-    def edit_page(self, id, playload):
+    def edit_page(self, id, playload, last_edited_time=None):
         tags = []
         for tag in playload['tags']:
             tags.append({
@@ -211,9 +399,7 @@ class WebCliper:
                 }
             }
         }
-        url = "https://api.notion.com/v1/pages/" + id
-        response = requests.patch(url, headers=self.headers, data=json.dumps(data))
-        return response.text
+        return self.patch_page(id, data, last_edited_time)
 
 
     def edit_articles_classify(self, url, next_cursor=None):
@@ -225,27 +411,20 @@ class WebCliper:
                 }
             },
         }
-        if next_cursor:
-            params['start_cursor'] = next_cursor
-        response = requests.post(url, headers=self.headers, data=json.dumps(params))
-        res = response.json()
-
-        for page in res['results']:
+        def classify(page):
             name = page['properties']['Name']['title'][0]['plain_text']
             labels = []
             for label in page['properties']['labels']['multi_select']:
                 labels.append(label['name'])
             print('Classifying ' + name )
             text = '记录的标题为：' + name + '，标签为：' + ','.join(labels)
-            self.classify_page(page['id'], text)
-        
-        if res['has_more']:
-            self.edit_articles_classify(url, res['next_cursor'])
-        
+            self.classify_page(page['id'], text, page.get('last_edited_time'))
+
+        self.run_pages(classify, self.query_pages(url, params, next_cursor))
         print('all done')
 
-    def classify_page(self, id, text):
-        ai = SummaryAi('llama3.1')
+    def classify_page(self, id, text, last_edited_time=None):
+        ai = self.summary_ai(CLASSIFY_MODEL)
         categories = ['区块链', 
         'ChatGPT', 
         'SEO', 
@@ -319,13 +498,13 @@ class WebCliper:
         print('分类为 ' + result)
 
         try:
-            self.edit_page_classify(id, result)
+            self.edit_page_classify(id, result, last_edited_time)
             print('----------------分类完成--------------')
         except Exception as e:
             print(e)
             print(result)
 
-    def edit_page_classify(self, id, playload):
+    def edit_page_classify(self, id, playload, last_edited_time=None):
         data = {
             "properties": {
                 "Classfiy": {
@@ -335,8 +514,31 @@ class WebCliper:
                 }
             }
         }
-        url = "https://api.notion.com/v1/pages/" + id
-        response = requests.patch(url, headers=self.headers, data=json.dumps(data))
+        return self.patch_page(id, data, last_edited_time)
+
+    def patch_page(self, id, data, last_edited_time=None):
+        """PATCH page properties and keep its cached content valid.
+
+        Property updates bump ``last_edited_time`` without touching the blocks,
+        so a cache entry stored under the time read before the PATCH is moved
+        to the time Notion returns.
+        """
+        url = self.notion_url + "/pages/" + id
+        try:
+            response = self.session.patch(url, headers=self.headers, data=json.dumps(data))
+        except requests.HTTPError as e:
+            if page_gone(e):
+                self.forget_page(id)
+            raise
+        if self.content_cache is None and self.mirror is None and self.search_index is None:
+            return response.text
+        page = response.json()
+        if self.mirror is not None:
+            self.mirror.upsert(page)
+        if self.search_index is not None:
+            self.search_index.index_page(page)
+        if self.content_cache is not None and last_edited_time and page.get('last_edited_time'):
+            self.content_cache.rekey(id, last_edited_time, page['last_edited_time'])
         return response.text
 
 if __name__ == "__main__":